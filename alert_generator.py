@@ -3,9 +3,124 @@ Alert Generator Module
 Generates human-readable alerts for SOP deviations and safety violations.
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterator
 from datetime import datetime
+from functools import lru_cache
+import bisect
 import json
+import time
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+
+# Raw severity value -> (display label, alert icon)
+_SEV_TABLE = {
+    "high": ("HIGH", "🔴"),
+    "medium": ("MEDIUM", "🟡"),
+    "low": ("LOW", "🟢")
+}
+_SEV_UNKNOWN_ICON = "⚠️"
+
+# Compliance grade thresholds (descending) and their (grade, icon) pairs.
+# _GRADES has one extra trailing entry for rates below the last threshold.
+_GRADE_THRESHOLDS = (90, 80, 70, 60)
+_NEG_GRADE_THRESHOLDS = tuple(-t for t in _GRADE_THRESHOLDS)
+_GRADES = (
+    ("A - Excellent", "🌟"),
+    ("B - Good", "✅"),
+    ("C - Acceptable", "🟡"),
+    ("D - Needs Improvement", "🟠"),
+    ("F - Critical Issues", "🔴")
+)
+
+# Report separators and fixed sections
+_EQ64 = "=" * 64
+_DASH64 = "─" * 64
+_REPORT_HEADER = (
+    "╔" + "═" * 64 + "╗\n"
+    "║          CONSTRUCTION SAFETY COMPLIANCE REPORT                 ║\n"
+    "╚" + "═" * 64 + "╝\n"
+)
+_FOOTER = f"\n{_EQ64}\nEnd of Report\n{_EQ64}\n"
+
+# Timestamp format used in report and alert file headers
+_TS_FMT = "%Y-%m-%d %H:%M:%S"
+
+# (epoch_second, formatted_string) of the last header timestamp
+_last_timestamp = (None, "")
+
+
+def _timestamp_now() -> str:
+    """
+    Return the current local time formatted with _TS_FMT.
+    
+    The formatted string only changes once per second, so it is memoized
+    per epoch second and strftime runs at most once a second.
+    
+    Returns:
+        Formatted timestamp string
+    """
+    global _last_timestamp
+    epoch_sec = int(time.time())
+    if epoch_sec != _last_timestamp[0]:
+        _last_timestamp = (epoch_sec, datetime.fromtimestamp(epoch_sec).strftime(_TS_FMT))
+    return _last_timestamp[1]
+
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(seconds: int) -> str:
+    """
+    Convert whole seconds to MM:SS format (memoized).
+    
+    Args:
+        seconds: Timestamp in whole seconds
+        
+    Returns:
+        Formatted timestamp string
+    """
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def dumps_json(data: Dict, pretty: bool = False) -> bytes:
+    """
+    Serialize data to UTF-8 JSON bytes.
+    
+    Uses orjson when it is installed and the stdlib json module otherwise.
+    
+    Args:
+        data: JSON-serializable data
+        pretty: Indent the output for human readers
+        
+    Returns:
+        Encoded JSON document
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if pretty:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def partition_deviations(compliance_results: List[Dict]) -> List[Dict]:
+    """
+    Select the deviating results from a compliance run.
+    
+    Compute this once and pass it to both generate_batch_alerts and
+    generate_summary_report so the results list is only scanned once.
+    
+    Args:
+        compliance_results: Results from SOPComparator.analyze_sequence
+        
+    Returns:
+        List of results flagged as deviations, in original order
+    """
+    return [r for r in compliance_results if r.get("is_deviation", False)]
 
 
 class AlertGenerator:
@@ -25,9 +140,7 @@ class AlertGenerator:
         Returns:
             Formatted timestamp string
         """
-        minutes = int(seconds // 60)
-        secs = int(seconds % 60)
-        return f"{minutes:02d}:{secs:02d}"
+        return _format_timestamp(int(seconds))
     
     def generate_deviation_alert(self, compliance_result: Dict) -> str:
         """
@@ -39,80 +152,112 @@ class AlertGenerator:
         Returns:
             Formatted alert message
         """
-        severity = compliance_result.get("severity", "medium").upper()
-        timestamp = self.format_timestamp(compliance_result.get("timestamp", 0))
-        
-        # Severity emoji
-        severity_icons = {
-            "HIGH": "🔴",
-            "MEDIUM": "🟡",
-            "LOW": "🟢"
-        }
-        icon = severity_icons.get(severity, "⚠️")
+        get = compliance_result.get
+        # None when the comparator skipped the check (lazy_checks)
+        tool_comp = get("tool_compliance") or {}
+        safety_comp = get("safety_compliance") or {}
+        hazards = get("potential_hazards", [])
+        sev_raw = get("severity", "medium")
+        seconds = int(get("timestamp", 0))
+        
+        sev_entry = _SEV_TABLE.get(sev_raw)
+        if sev_entry is not None:
+            severity, icon = sev_entry
+        else:
+            # Non-canonical spelling ("High") or unknown value
+            severity = sev_raw.upper()
+            icon = _SEV_TABLE.get(sev_raw.lower(), (severity, _SEV_UNKNOWN_ICON))[1]
+        timestamp = _format_timestamp(seconds)
+        step_number = get("step_number", "N/A")
+        expected = get("matched_sop_step", "Unknown")
+        observed = get("observed_action", "Unknown")
+        similarity = get("similarity_score", 0)
         
-        alert = f"""
+        # Collect sections in a list and join once instead of repeated str +=
+        parts = [f"""
 {icon} COMPLIANCE ALERT - {severity} SEVERITY
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 Time: {timestamp}
-Step #{compliance_result.get('step_number', 'N/A')}
+Step #{step_number}
 
 Expected Action:
-  {compliance_result.get('matched_sop_step', 'Unknown')}
+  {expected}
 
 Observed Action:
-  {compliance_result.get('observed_action', 'Unknown')}
+  {observed}
 
-Similarity Score: {compliance_result.get('similarity_score', 0):.1%}
-"""
+Similarity Score: {similarity:.1%}
+"""]
+        append = parts.append
         
         # Add tool violations
-        tool_comp = compliance_result.get("tool_compliance", {})
         if not tool_comp.get("is_compliant", True):
-            alert += "\n⚠️ TOOL VIOLATIONS:\n"
-            if tool_comp.get("missing_tools"):
-                alert += f"  Missing: {', '.join(tool_comp['missing_tools'])}\n"
-            if tool_comp.get("wrong_tools"):
-                alert += f"  Wrong tools used: {', '.join(tool_comp['wrong_tools'])}\n"
+            append("\n⚠️ TOOL VIOLATIONS:\n")
+            missing_tools = tool_comp.get("missing_tools")
+            if missing_tools:
+                append(f"  Missing: {', '.join(missing_tools)}\n")
+            wrong_tools = tool_comp.get("wrong_tools")
+            if wrong_tools:
+                append(f"  Wrong tools used: {', '.join(wrong_tools)}\n")
         
         # Add safety violations
-        safety_comp = compliance_result.get("safety_compliance", {})
         if not safety_comp.get("is_compliant", True):
-            alert += "\n🚨 SAFETY EQUIPMENT VIOLATIONS:\n"
-            if safety_comp.get("missing_equipment"):
-                alert += f"  Missing: {', '.join(safety_comp['missing_equipment'])}\n"
+            append("\n🚨 SAFETY EQUIPMENT VIOLATIONS:\n")
+            missing_equipment = safety_comp.get("missing_equipment")
+            if missing_equipment:
+                append(f"  Missing: {', '.join(missing_equipment)}\n")
         
         # Add hazards if any
-        hazards = compliance_result.get("potential_hazards", [])
         if hazards:
-            alert += f"\n⚠️ POTENTIAL HAZARDS DETECTED:\n"
-            for hazard in hazards:
-                alert += f"  • {hazard}\n"
+            append("\n⚠️ POTENTIAL HAZARDS DETECTED:\n")
+            parts.extend(f"  • {hazard}\n" for hazard in hazards)
         
-        alert += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+        append("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n")
         
         self.alert_count += 1
-        return alert
+        return "".join(parts)
     
-    def generate_batch_alerts(self, compliance_results: List[Dict]) -> List[str]:
+    def generate_batch_alerts(self, compliance_results: List[Dict], deviations: Optional[List[Dict]] = None) -> List[str]:
         """
         Generate alerts for all deviations in results.
         
         Args:
             compliance_results: List of compliance check results
+            deviations: Pre-filtered deviations (see partition_deviations);
+                computed from compliance_results when omitted
             
         Returns:
             List of alert messages
         """
-        alerts = []
+        if deviations is None:
+            deviations = partition_deviations(compliance_results)
+        
+        gen = self.generate_deviation_alert
+        return [gen(r) for r in deviations]
+    
+    def iter_batch_alerts(self, compliance_results: List[Dict], deviations: Optional[List[Dict]] = None) -> Iterator[str]:
+        """
+        Lazily generate alerts for all deviations in results.
+        
+        Streaming variant of generate_batch_alerts for large result sets,
+        so callers can render alerts as they are produced.
         
-        for result in compliance_results:
-            if result.get("is_deviation", False):
-                alert = self.generate_deviation_alert(result)
-                alerts.append(alert)
+        Args:
+            compliance_results: List of compliance check results
+            deviations: Pre-filtered deviations (see partition_deviations)
+            
+        Yields:
+            Alert messages, in result order
+        """
+        if deviations is None:
+            deviations = (r for r in compliance_results if r.get("is_deviation", False))
         
-        return alerts
+        gen = self.generate_deviation_alert
+        for result in deviations:
+            yield gen(result)
     
-    def generate_summary_report(self, compliance_results: List[Dict], summary: Dict, sop_name: str = "Unknown Task") -> str:
+    def generate_summary_report(self, compliance_results: List[Dict], summary: Dict, sop_name: str = "Unknown Task",
+                                deviations: Optional[List[Dict]] = None) -> str:
         """
         Generate comprehensive summary report.
         
@@ -120,95 +265,101 @@ Similarity Score: {compliance_result.get('similarity_score', 0):.1%}
             compliance_results: List of compliance check results
             summary: Summary statistics dictionary
             sop_name: Name of the SOP task
+            deviations: Pre-filtered deviations (see partition_deviations);
+                computed from compliance_results when omitted
             
         Returns:
             Formatted summary report
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = _timestamp_now()
+        
+        # Read every summary field exactly once
+        g = summary.get
+        total_frames = g("total_frames_analyzed", 0)
+        compliance_rate = g("compliance_rate", 0)
+        avg_similarity = g("average_similarity", 0)
+        total_deviations = g("total_deviations", 0)
+        high_severity = g("high_severity_count", 0)
+        medium_severity = g("medium_severity_count", 0)
+        tool_violations = g("tool_violations", 0)
+        safety_violations = g("safety_violations", 0)
         
         # Calculate compliance grade
-        compliance_rate = summary.get("compliance_rate", 0)
-        if compliance_rate >= 90:
-            grade = "A - Excellent"
-            grade_icon = "🌟"
-        elif compliance_rate >= 80:
-            grade = "B - Good"
-            grade_icon = "✅"
-        elif compliance_rate >= 70:
-            grade = "C - Acceptable"
-            grade_icon = "🟡"
-        elif compliance_rate >= 60:
-            grade = "D - Needs Improvement"
-            grade_icon = "🟠"
-        else:
-            grade = "F - Critical Issues"
-            grade_icon = "🔴"
+        idx = bisect.bisect_left(_NEG_GRADE_THRESHOLDS, -compliance_rate)
+        grade, grade_icon = _GRADES[idx]
         
-        report = f"""
-╔════════════════════════════════════════════════════════════════╗
-║          CONSTRUCTION SAFETY COMPLIANCE REPORT                 ║
-╚════════════════════════════════════════════════════════════════╝
-
+        stats_block = f"""
+{_REPORT_HEADER}
 Task: {sop_name}
 Generated: {timestamp}
 
-{'='*64}
+{_EQ64}
 OVERALL COMPLIANCE GRADE: {grade_icon} {grade}
-{'='*64}
+{_EQ64}
 
 📊 STATISTICS
-────────────────────────────────────────────────────────────────
-Total Frames Analyzed:     {summary.get('total_frames_analyzed', 0)}
+{_DASH64}
+Total Frames Analyzed:     {total_frames}
 Compliance Rate:           {compliance_rate}%
-Average Similarity Score:  {summary.get('average_similarity', 0):.1%}
+Average Similarity Score:  {avg_similarity:.1%}
 
-Total Deviations:          {summary.get('total_deviations', 0)}
-  • High Severity:         {summary.get('high_severity_count', 0)}
-  • Medium Severity:       {summary.get('medium_severity_count', 0)}
+Total Deviations:          {total_deviations}
+  • High Severity:         {high_severity}
+  • Medium Severity:       {medium_severity}
 
 Specific Violations:
-  • Tool Violations:       {summary.get('tool_violations', 0)}
-  • Safety Equipment:      {summary.get('safety_violations', 0)}
+  • Tool Violations:       {tool_violations}
+  • Safety Equipment:      {safety_violations}
 
 """
         
+        # Clean run: no timeline to build and nothing to recommend
+        if (total_deviations == 0 and total_frames > 0 and compliance_rate >= 70
+                and not (safety_violations or tool_violations or high_severity)):
+            return f"{stats_block}✅ No deviations detected.\n{_FOOTER}"
+        
+        report_parts = [stats_block]
+        append = report_parts.append
+        
         # Add deviation timeline
-        if summary.get("total_deviations", 0) > 0:
-            report += "⏱️ DEVIATION TIMELINE\n"
-            report += "─" * 64 + "\n"
+        if total_deviations > 0:
+            append("⏱️ DEVIATION TIMELINE\n")
+            append(f"{_DASH64}\n")
             
-            deviations = [r for r in compliance_results if r.get("is_deviation", False)]
+            if deviations is None:
+                deviations = partition_deviations(compliance_results)
+            fmt = self.format_timestamp
+            get = dict.get
             for i, dev in enumerate(deviations[:10], 1):  # Show first 10
-                timestamp_str = self.format_timestamp(dev.get("timestamp", 0))
-                severity = dev.get("severity", "medium").upper()
-                report += f"{i}. {timestamp_str} - {severity} - Step #{dev.get('step_number', 'N/A')}\n"
+                timestamp_str = fmt(get(dev, "timestamp", 0))
+                severity = get(dev, "severity", "medium").upper()
+                step = get(dev, "step_number", "N/A")
+                append(f"{i}. {timestamp_str} - {severity} - Step #{step}\n")
             
             if len(deviations) > 10:
-                report += f"\n... and {len(deviations) - 10} more deviations\n"
-            report += "\n"
+                append(f"\n... and {len(deviations) - 10} more deviations\n")
+            append("\n")
         
         # Recommendations
-        report += "💡 RECOMMENDATIONS\n"
-        report += "─" * 64 + "\n"
+        append("💡 RECOMMENDATIONS\n")
+        append(f"{_DASH64}\n")
         
-        if summary.get("safety_violations", 0) > 0:
-            report += "• CRITICAL: Ensure all workers wear required safety equipment\n"
+        if safety_violations > 0:
+            append("• CRITICAL: Ensure all workers wear required safety equipment\n")
         
-        if summary.get("tool_violations", 0) > 0:
-            report += "• Provide proper tool training and ensure correct tools are available\n"
+        if tool_violations > 0:
+            append("• Provide proper tool training and ensure correct tools are available\n")
         
         if compliance_rate < 70:
-            report += "• Consider additional SOP training for workers\n"
-            report += "• Implement more frequent supervision and checks\n"
+            append("• Consider additional SOP training for workers\n")
+            append("• Implement more frequent supervision and checks\n")
         
-        if summary.get("high_severity_count", 0) > 0:
-            report += "• URGENT: Review high-severity deviations immediately\n"
+        if high_severity > 0:
+            append("• URGENT: Review high-severity deviations immediately\n")
         
-        report += "\n" + "=" * 64 + "\n"
-        report += "End of Report\n"
-        report += "=" * 64 + "\n"
+        append(_FOOTER)
         
-        return report
+        return "".join(report_parts)
     
     def save_alerts_to_file(self, alerts: List[str], filename: str = "alerts.txt"):
         """
@@ -218,19 +369,24 @@ Specific Violations:
             alerts: List of alert messages
             filename: Output filename
         """
-        with open(filename, 'w') as f:
-            f.write(f"Construction Safety Alerts\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 64 + "\n\n")
-            
-            for i, alert in enumerate(alerts, 1):
-                f.write(f"Alert #{i}\n")
-                f.write(alert)
-                f.write("\n")
+        parts = [
+            "Construction Safety Alerts\n",
+            f"Generated: {_timestamp_now()}\n",
+            f"{_EQ64}\n\n",
+        ]
+        parts_extend = parts.extend
+        for i, alert in enumerate(alerts, 1):
+            parts_extend((f"Alert #{i}\n", alert, "\n"))
+        
+        # Encode once and write bytes; only "\n" is emitted so no newline translation is needed
+        blob = "".join(parts).encode("utf-8")
+        with open(filename, 'wb', buffering=1 << 20) as f:
+            f.write(blob)
         
         print(f"✅ Alerts saved to {filename}")
     
-    def export_json(self, compliance_results: List[Dict], summary: Dict, filename: str = "compliance_report.json"):
+    def export_json(self, compliance_results: List[Dict], summary: Dict, filename: str = "compliance_report.json",
+                    pretty: bool = False):
         """
         Export results to JSON format.
         
@@ -238,6 +394,7 @@ Specific Violations:
             compliance_results: List of compliance check results
             summary: Summary statistics
             filename: Output filename
+            pretty: Indent the output (compact by default for machine consumers)
         """
         data = {
             "timestamp": datetime.now().isoformat(),
@@ -245,8 +402,9 @@ Specific Violations:
             "detailed_results": compliance_results
         }
         
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        payload = dumps_json(data, pretty=pretty)
+        with open(filename, 'wb', buffering=1 << 20) as f:
+            f.write(payload)
         
         print(f"✅ JSON report saved to {filename}")
 
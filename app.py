@@ -6,17 +6,15 @@ Web-based dashboard for the Construction Safety Monitor.
 import streamlit as st
 import os
 import sys
-import json
 from pathlib import Path
-import tempfile
-import time
 
 # Add src to path
 sys.path.append(str(Path(__file__).parent / "src"))
 
-from src.video_analyzer import VideoAnalyzer
-from src.sop_comparator import SOPComparator
-from src.alert_generator import AlertGenerator
+from src.utils import load_json_file
+
+# The analysis modules (Gemini SDK, OpenCV, sentence-transformers) are
+# imported lazily inside the analyze branch of main() to keep first render fast.
 
 
 # Page configuration
@@ -51,25 +49,44 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def load_available_sops():
-    """Load all available SOP files from config directory."""
-    config_dir = Path("config")
-    if not config_dir.exists():
-        return {}
+@st.cache_data(show_spinner=False)
+def load_available_sops_cached(mtimes: tuple) -> dict:
+    """
+    Load all available SOP files from config directory.
     
+    mtimes is a tuple of (path, mtime_ns) pairs; it only serves as the
+    cache key so the files are re-parsed when one of them changes.
+    """
     sops = {}
-    for sop_file in config_dir.glob("*.json"):
+    for sop_file, _ in mtimes:
+        sop_file = Path(sop_file)
         if sop_file.stem != "sop_template":
             try:
-                with open(sop_file, 'r') as f:
-                    sop_data = json.load(f)
-                    sops[sop_data.get("task_name", sop_file.stem)] = str(sop_file)
+                sop_data = load_json_file(sop_file)
+                sops[sop_data.get("task_name", sop_file.stem)] = str(sop_file)
             except Exception as e:
                 st.error(f"Error loading {sop_file}: {e}")
     
     return sops
 
 
+def load_available_sops():
+    """Load all available SOP files from config directory."""
+    config_dir = Path("config")
+    if not config_dir.exists():
+        return {}
+    
+    files = sorted(config_dir.glob("*.json"))
+    key = tuple((str(f), f.stat().st_mtime_ns) for f in files)
+    return load_available_sops_cached(key)
+
+
+@st.cache_data(show_spinner=False)
+def load_sop(sop_path: str, mtime: int) -> dict:
+    """Load a single SOP file; mtime is part of the cache key."""
+    return load_json_file(sop_path)
+
+
 def main():
     """Main Streamlit application."""
     
@@ -111,8 +128,7 @@ def main():
         selected_sop_path = available_sops[selected_sop_name]
         
         # Load and display SOP details
-        with open(selected_sop_path, 'r') as f:
-            sop_data = json.load(f)
+        sop_data = load_sop(selected_sop_path, os.stat(selected_sop_path).st_mtime_ns)
         
         with st.expander("SOP Details"):
             st.write(f"**Task:** {sop_data.get('task_name', 'N/A')}")
@@ -202,9 +218,15 @@ def main():
     analyze_button = st.button("🚀 Start Analysis", type="primary", use_container_width=True)
     
     if analyze_button:
+        import tempfile
+        import shutil
+        from src.video_analyzer import VideoAnalyzer
+        from src.sop_comparator import SOPComparator
+        from src.alert_generator import AlertGenerator, dumps_json, partition_deviations
+        
         # Save uploaded file temporarily
         with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp_file:
-            tmp_file.write(uploaded_file.read())
+            shutil.copyfileobj(uploaded_file, tmp_file, length=1 << 20)
             video_path = tmp_file.name
         
         try:
@@ -245,11 +267,12 @@ def main():
             progress_bar.progress(80)
             
             alert_gen = AlertGenerator()
-            alerts = alert_gen.generate_batch_alerts(compliance_results)
+            deviations = partition_deviations(compliance_results)
             report = alert_gen.generate_summary_report(
                 compliance_results,
                 summary,
-                sop_data.get("task_name", "Unknown Task")
+                sop_data.get("task_name", "Unknown Task"),
+                deviations=deviations
             )
             
             progress_bar.progress(100)
@@ -308,10 +331,13 @@ def main():
                 )
             
             with tab2:
-                if alerts:
-                    for i, alert in enumerate(alerts, 1):
+                if deviations:
+                    # Render each alert as it is generated
+                    alerts = []
+                    for i, alert in enumerate(alert_gen.iter_batch_alerts(compliance_results, deviations=deviations), 1):
                         with st.expander(f"Alert #{i}", expanded=(i <= 3)):
                             st.text(alert)
+                        alerts.append(alert)
                     
                     # Download alerts
                     alerts_text = "\n\n".join(alerts)
@@ -356,11 +382,13 @@ def main():
                                 st.success(result.get("observed_action", "N/A"))
                         
                         # Additional details
-                        if not result["tool_compliance"]["is_compliant"]:
-                            st.warning(f"⚠️ Tool issues: Missing {result['tool_compliance']['missing_tools']}")
+                        tool_compliance = result["tool_compliance"] or {"is_compliant": True}
+                        if not tool_compliance["is_compliant"]:
+                            st.warning(f"⚠️ Tool issues: Missing {tool_compliance['missing_tools']}")
                         
-                        if not result["safety_compliance"]["is_compliant"]:
-                            st.error(f"🚨 Safety issues: Missing {result['safety_compliance']['missing_equipment']}")
+                        safety_compliance = result["safety_compliance"] or {"is_compliant": True}
+                        if not safety_compliance["is_compliant"]:
+                            st.error(f"🚨 Safety issues: Missing {safety_compliance['missing_equipment']}")
                 
                 # Download JSON
                 json_data = {
@@ -370,7 +398,7 @@ def main():
                 
                 st.download_button(
                     "📥 Download JSON Report",
-                    data=json.dumps(json_data, indent=2),
+                    data=dumps_json(json_data, pretty=True),
                     file_name=f"{Path(uploaded_file.name).stem}_compliance.json",
                     mime="application/json"
                 )
@@ -11,10 +11,6 @@ from pathlib import Path
 # Add src to path
 sys.path.append(str(Path(__file__).parent))
 
-from video_analyzer import VideoAnalyzer
-from sop_comparator import SOPComparator
-from alert_generator import AlertGenerator
-
 
 def main():
     """Main entry point for the CLI application."""
@@ -90,6 +86,11 @@ Examples:
     # Create output directory
     os.makedirs(args.output, exist_ok=True)
     
+    # Imported here so --help and input errors don't pay for torch/model imports
+    from video_analyzer import VideoAnalyzer
+    from sop_comparator import SOPComparator
+    from alert_generator import AlertGenerator, partition_deviations
+    
     print("=" * 70)
     print("🏗️  CONSTRUCTION SAFETY MONITOR")
     print("=" * 70)
@@ -130,7 +131,8 @@ Examples:
         print("-" * 70)
         alert_gen = AlertGenerator()
         
-        alerts = alert_gen.generate_batch_alerts(compliance_results)
+        deviations = partition_deviations(compliance_results)
+        alerts = alert_gen.generate_batch_alerts(compliance_results, deviations=deviations)
         print(f"Generated {len(alerts)} alerts")
         
         # Step 4: Create Reports
@@ -141,7 +143,8 @@ Examples:
         report = alert_gen.generate_summary_report(
             compliance_results, 
             summary, 
-            sop.get("task_name", "Unknown Task")
+            sop.get("task_name", "Unknown Task"),
+            deviations=deviations
         )
         
         # Save reports
@@ -170,7 +173,7 @@ Examples:
         if alerts:
             print("\n🚨 KEY ALERTS:")
             print("-" * 70)
-            high_priority = [a for r in compliance_results if r.get("is_deviation") and r.get("severity") == "high" for a in [alert_gen.generate_deviation_alert(r)]]
+            high_priority = [alert for r, alert in zip(deviations, alerts) if r.get("severity") == "high"]
             
             for alert in high_priority[:3]:  # Show top 3 high-priority alerts
                 print(alert)
@@ -3,15 +3,151 @@ SOP Comparator Module
 Compares observed worker actions against Standard Operating Procedures.
 """
 
+import hashlib
 import json
 import os
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+import numpy as np
 from sentence_transformers import SentenceTransformer, util
 import torch
 from dotenv import load_dotenv
 
+from utils import load_json_file
+
 load_dotenv()
 
+# Sentences per transformer forward pass in batched encode() calls
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", 64))
+
+# SOPs with at least this many steps are matched with chunked top-1 search
+SEMANTIC_SEARCH_MIN_STEPS = 256
+
+# Maximum number of worker-action embeddings kept in the per-comparator LRU cache
+ACTION_CACHE_SIZE = 10_000
+
+# Similarity below which a match is a high-severity deviation
+HIGH_SEVERITY_SIMILARITY = 0.5
+
+# On-disk cache for encoded SOP step embeddings
+SOP_CACHE_DIR = Path(os.getenv("SOP_CACHE_DIR", "~/.cache/safety_monitor")).expanduser()
+
+
+# Severity codes used in ComplianceResults.severity
+_SEVERITY_CODES = {"high": 2, "medium": 1}
+
+
+class ComplianceResults(list):
+    """
+    Per-frame compliance result dicts with parallel numpy columns.
+    
+    Returned by SOPComparator.analyze_sequence. Behaves as a plain list of
+    dicts; the columns let generate_summary aggregate with numpy reductions
+    instead of iterating dicts. Columns are not updated if the dicts are
+    mutated afterwards.
+    """
+    
+    def __init__(self, size: int):
+        """
+        Preallocate the columns for size frames.
+        
+        Args:
+            size: Number of frames that will be appended
+        """
+        super().__init__()
+        self.similarity = np.empty(size, dtype=np.float64)
+        self.is_deviation = np.zeros(size, dtype=bool)
+        self.severity = np.zeros(size, dtype=np.int8)
+        self.tool_violation = np.zeros(size, dtype=bool)
+        self.safety_violation = np.zeros(size, dtype=bool)
+    
+    def add(self, result: Dict):
+        """
+        Append a result dict and fill its column entries.
+        
+        Args:
+            result: Compliance result built by analyze_sequence
+        """
+        i = len(self)
+        self.append(result)
+        self.similarity[i] = result["similarity_score"]
+        self.is_deviation[i] = result["is_deviation"]
+        self.severity[i] = _SEVERITY_CODES.get(result["severity"], 0)
+        tool_check = result["tool_compliance"]
+        self.tool_violation[i] = tool_check is not None and not tool_check["is_compliant"]
+        safety_check = result["safety_compliance"]
+        self.safety_violation[i] = safety_check is not None and not safety_check["is_compliant"]
+
+
+class ONNXSentenceEncoder:
+    """
+    ONNX Runtime replacement for SentenceTransformer.encode.
+    
+    Exports the Hugging Face model with optimum on first use and keeps the
+    exported graph under SOP_CACHE_DIR/onnx. Embeddings are mean-pooled
+    over non-padding tokens, matching the default MiniLM/MPNet pooling.
+    Enabled with USE_ONNX=1; requires `optimum[onnxruntime]`.
+    """
+    
+    def __init__(self, model_name: str):
+        """
+        Load (or export) the ONNX model and its tokenizer.
+        
+        Args:
+            model_name: Hugging Face model name
+        """
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        
+        export_dir = SOP_CACHE_DIR / "onnx" / model_name.replace("/", "__")
+        if (export_dir / "model.onnx").exists():
+            self.model = ORTModelForFeatureExtraction.from_pretrained(export_dir)
+            self.tokenizer = AutoTokenizer.from_pretrained(export_dir, use_fast=True)
+        else:
+            self.model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+            self.model.save_pretrained(export_dir)
+            self.tokenizer.save_pretrained(export_dir)
+        self.device = torch.device("cpu")
+    
+    def encode(self, sentences, batch_size: int = 32, convert_to_tensor: bool = False,
+               normalize_embeddings: bool = False, show_progress_bar: bool = None):
+        """
+        Encode sentences into embeddings (subset of SentenceTransformer.encode).
+        
+        Args:
+            sentences: A sentence or list of sentences
+            batch_size: Sentences per ONNX Runtime call
+            convert_to_tensor: Return a torch tensor instead of a numpy array
+            normalize_embeddings: L2-normalize the embeddings
+            show_progress_bar: Accepted for compatibility; ignored
+            
+        Returns:
+            Embedding per sentence (a single vector for a string input)
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        # Length-sorted batches keep padding small; undone after pooling
+        order = sorted(range(len(sentences)), key=lambda i: -len(sentences[i]))
+        chunks = []
+        for start in range(0, len(order), batch_size):
+            batch = [sentences[i] for i in order[start:start + batch_size]]
+            features = self.tokenizer(batch, padding=True, truncation=True, return_tensors="pt")
+            with torch.no_grad():
+                token_embeddings = self.model(**features).last_hidden_state
+            mask = features["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+            chunks.append((token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9))
+        
+        embeddings = torch.cat(chunks)[torch.argsort(torch.tensor(order))]
+        if normalize_embeddings:
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        if single:
+            embeddings = embeddings[0]
+        return embeddings if convert_to_tensor else embeddings.numpy()
+
 
 class SOPComparator:
     """Compares worker actions against SOP steps using semantic similarity."""
@@ -24,9 +160,36 @@ class SOPComparator:
             model_name: Name of the sentence transformer model
         """
         self.model_name = model_name or os.getenv("SIMILARITY_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-        print(f"Loading similarity model: {self.model_name}")
-        self.model = SentenceTransformer(self.model_name)
+        use_onnx = os.getenv("USE_ONNX", "0") == "1"
+        self.backend = "onnx" if use_onnx else "torch"
+        self.quantized = False
+        self.device = "cuda" if torch.cuda.is_available() and not use_onnx else "cpu"
+        self._embedding_dtype = torch.float32
+        print(f"Loading similarity model: {self.model_name} ({'onnx' if use_onnx else self.device})")
+        if use_onnx:
+            self.model = ONNXSentenceEncoder(self.model_name)
+        else:
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+            tokenizer = getattr(self.model, "tokenizer", None)
+            if tokenizer is not None and not getattr(tokenizer, "is_fast", False):
+                print(f"⚠️ {self.model_name} has no fast (Rust) tokenizer; tokenization may bottleneck encoding")
+            if self.device == "cuda":
+                # fp16 inference on GPU
+                self.model.half()
+                self._embedding_dtype = torch.float16
+            elif os.getenv("QUANTIZE", "0") == "1":
+                # int8 dynamic quantization of the Linear layers for CPU inference
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+                self.quantized = True
+        if self.device == "cpu":
+            torch.set_num_threads(int(os.getenv("ST_NUM_THREADS", os.cpu_count() or 1)))
         self.threshold = float(os.getenv("SIMILARITY_THRESHOLD", 0.70))
+        # Skip tool/safety checks for frames that are already high-severity
+        # deviations on similarity alone (their compliance fields are None)
+        self.lazy_checks = os.getenv("LAZY_COMPLIANCE_CHECKS", "0") == "1"
+        self.use_faiss = os.getenv("USE_FAISS", "0") == "1"
+        self._sop_cache: Dict[str, torch.Tensor] = {}
+        self._action_emb_cache: "OrderedDict[str, torch.Tensor]" = OrderedDict()
         
     def load_sop(self, sop_path: str) -> Dict:
         """
@@ -38,13 +201,74 @@ class SOPComparator:
         Returns:
             Dictionary containing SOP data
         """
-        with open(sop_path, 'r') as f:
-            sop = json.load(f)
+        sop = load_json_file(sop_path)
         
         print(f"\n📋 Loaded SOP: {sop.get('task_name', 'Unknown Task')}")
         print(f"   Steps: {len(sop.get('steps', []))}")
         return sop
     
+    def _sop_cache_key(self, sop_descriptions: List[str]) -> str:
+        """
+        Build a cache key for a list of SOP step descriptions.
+        
+        Args:
+            sop_descriptions: SOP step action texts, in step order
+            
+        Returns:
+            Hex digest identifying the model setup and step texts
+        """
+        payload = json.dumps({
+            "model": self.model_name,
+            "backend": self.backend,
+            "device": self.device,
+            "dtype": str(self._embedding_dtype),
+            "normalized": True,
+            "quantized": self.quantized,
+            "steps": sop_descriptions
+        })
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    
+    def _load_sop_embeddings(self, key: str) -> Optional[torch.Tensor]:
+        """
+        Look up cached SOP step embeddings in memory, then on disk.
+        
+        Args:
+            key: Cache key from _sop_cache_key
+            
+        Returns:
+            Embedding tensor, or None if not cached
+        """
+        embeddings = self._sop_cache.get(key)
+        if embeddings is not None:
+            return embeddings
+        
+        cache_file = SOP_CACHE_DIR / f"{key}.pt"
+        if cache_file.exists():
+            try:
+                embeddings = torch.load(cache_file, map_location=self.device, weights_only=True)
+                # Match the model's precision (fp16 on GPU, fp32 on CPU)
+                embeddings = embeddings.to(self._embedding_dtype)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable SOP embedding cache {cache_file}: {e}")
+                return None
+            self._sop_cache[key] = embeddings
+        return embeddings
+    
+    def _store_sop_embeddings(self, key: str, embeddings: torch.Tensor):
+        """
+        Cache SOP step embeddings in memory and on disk.
+        
+        Args:
+            key: Cache key from _sop_cache_key
+            embeddings: Encoded SOP steps
+        """
+        self._sop_cache[key] = embeddings
+        try:
+            SOP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            torch.save(embeddings.cpu(), SOP_CACHE_DIR / f"{key}.pt")
+        except OSError as e:
+            print(f"⚠️ Could not write SOP embedding cache: {e}")
+    
     def compute_similarity(self, action: str, sop_step: str) -> float:
         """
         Compute semantic similarity between action and SOP step.
@@ -57,11 +281,11 @@ class SOPComparator:
             Similarity score (0.0 to 1.0)
         """
         # Encode both texts
-        action_embedding = self.model.encode(action, convert_to_tensor=True)
-        sop_embedding = self.model.encode(sop_step, convert_to_tensor=True)
+        action_embedding = self.model.encode(action, convert_to_tensor=True, normalize_embeddings=True)
+        sop_embedding = self.model.encode(sop_step, convert_to_tensor=True, normalize_embeddings=True)
         
-        # Compute cosine similarity
-        similarity = util.cos_sim(action_embedding, sop_embedding)
+        # Cosine similarity of L2-normalized embeddings is their dot product
+        similarity = action_embedding @ sop_embedding
         
         return similarity.item()
     
@@ -84,19 +308,57 @@ class SOPComparator:
         sop_descriptions = [step["action"] for step in sop_steps]
         
         # Encode all at once for efficiency
-        action_embedding = self.model.encode(action, convert_to_tensor=True)
-        sop_embeddings = self.model.encode(sop_descriptions, convert_to_tensor=True)
+        action_embedding = self.model.encode(action, convert_to_tensor=True, normalize_embeddings=True)
+        sop_embeddings = self.model.encode(sop_descriptions, convert_to_tensor=True, normalize_embeddings=True)
         
-        # Compute similarities
-        similarities = util.cos_sim(action_embedding, sop_embeddings)
+        # Compute cosine similarities (dot product of normalized embeddings)
+        similarities = sop_embeddings @ action_embedding
         
         # Find best match
         best_idx = similarities.argmax().item()
-        best_score = similarities[0][best_idx].item()
+        best_score = similarities[best_idx].item()
         best_step = sop_steps[best_idx]
         
         return best_idx, best_score, best_step
     
+    def _best_matches(self, action_embeddings: torch.Tensor, sop_embeddings: torch.Tensor) -> Tuple[List[int], List[float]]:
+        """
+        Find the best matching SOP step for every action embedding.
+        
+        Small SOPs use one dense similarity matrix. Large SOPs use chunked
+        top-1 search (faiss when USE_FAISS=1 and installed, otherwise
+        sentence-transformers' semantic_search) to bound memory.
+        
+        Args:
+            action_embeddings: Normalized action embeddings, shape (N, D)
+            sop_embeddings: Normalized SOP step embeddings, shape (M, D)
+            
+        Returns:
+            Tuple of (best step index per action, best similarity per action)
+        """
+        if len(sop_embeddings) >= SEMANTIC_SEARCH_MIN_STEPS:
+            if self.use_faiss:
+                import faiss
+                
+                index = faiss.IndexFlatIP(sop_embeddings.shape[1])
+                index.add(sop_embeddings.float().cpu().numpy())
+                scores, indices = index.search(action_embeddings.float().cpu().numpy(), 1)
+                return indices[:, 0].tolist(), scores[:, 0].tolist()
+            
+            hits = util.semantic_search(
+                action_embeddings, sop_embeddings, top_k=1,
+                query_chunk_size=1000, corpus_chunk_size=500000,
+                score_function=util.dot_score
+            )
+            return [h[0]["corpus_id"] for h in hits], [float(h[0]["score"]) for h in hits]
+        
+        similarities = action_embeddings @ sop_embeddings.T  # (actions, steps), cosine
+        best_indices = similarities.argmax(dim=1)
+        best_scores = similarities.gather(1, best_indices.unsqueeze(1)).squeeze(1)
+        
+        # One device->host transfer for all rows instead of .item() per action
+        return best_indices.cpu().tolist(), best_scores.float().cpu().tolist()
+    
     def check_tool_compliance(self, observed_tools: List[str], required_tools: List[str]) -> Dict:
         """
         Check if correct tools are being used.
@@ -111,10 +373,28 @@ class SOPComparator:
         observed_tools_lower = [tool.lower() for tool in observed_tools]
         required_tools_lower = [tool.lower() for tool in required_tools]
         
+        return self._check_tools_lowered(observed_tools_lower, required_tools_lower, set(required_tools_lower))
+    
+    def _check_tools_lowered(self, observed_tools_lower: List[str], required_tools_lower: List[str],
+                             required_set: set) -> Dict:
+        """
+        Tool compliance check on already-lowercased inputs.
+        
+        Args:
+            observed_tools_lower: Lowercased observed tools
+            required_tools_lower: Lowercased required tools
+            required_set: set(required_tools_lower), precomputed by the caller
+            
+        Returns:
+            Dictionary with compliance status and details
+        """
+        # Set membership keeps this O(R+O); lists keep the original order
+        observed_set = set(observed_tools_lower)
+        
         missing_tools = [tool for tool in required_tools_lower 
-                        if tool not in observed_tools_lower]
+                        if tool not in observed_set]
         wrong_tools = [tool for tool in observed_tools_lower 
-                      if tool not in required_tools_lower and tool != ""]
+                      if tool not in required_set and tool != ""]
         
         is_compliant = len(missing_tools) == 0
         
@@ -140,7 +420,21 @@ class SOPComparator:
         observed_lower = [eq.lower() for eq in observed_equipment]
         required_lower = [eq.lower() for eq in required_equipment]
         
-        missing_equipment = [eq for eq in required_lower if eq not in observed_lower]
+        return self._check_safety_lowered(observed_lower, required_lower)
+    
+    def _check_safety_lowered(self, observed_lower: List[str], required_lower: List[str]) -> Dict:
+        """
+        Safety equipment check on already-lowercased inputs.
+        
+        Args:
+            observed_lower: Lowercased observed equipment
+            required_lower: Lowercased required equipment
+            
+        Returns:
+            Dictionary with compliance status
+        """
+        observed_set = set(observed_lower)
+        missing_equipment = [eq for eq in required_lower if eq not in observed_set]
         
         return {
             "is_compliant": len(missing_equipment) == 0,
@@ -160,48 +454,122 @@ class SOPComparator:
         Returns:
             List of compliance checks with deviations
         """
-        results = []
+        results = ComplianceResults(len(video_actions))
         sop_steps = sop.get("steps", [])
         
         print(f"\n🔍 Analyzing {len(video_actions)} actions against {len(sop_steps)} SOP steps...")
         
-        for i, action_data in enumerate(video_actions):
-            action_desc = action_data.get("worker_action", "")
-            timestamp = action_data.get("timestamp", 0)
-            
-            # Find best matching SOP step
-            step_idx, similarity, matched_step = self.find_best_match(action_desc, sop_steps)
-            
-            # Check tool compliance
-            tool_check = self.check_tool_compliance(
-                action_data.get("tools_visible", []),
-                matched_step.get("required_tools", [])
+        if not video_actions:
+            return results
+        
+        # Encode all actions in one batch and match every action against every
+        # step with one similarity matrix. SOP step embeddings are cached, since
+        # the same SOP is usually checked against many videos.
+        sop_descriptions = [step["action"] for step in sop_steps]
+        action_descriptions = [action_data.get("worker_action", "") for action_data in video_actions]
+        
+        cache_key = self._sop_cache_key(sop_descriptions)
+        sop_embeddings = self._load_sop_embeddings(cache_key)
+        
+        # Adjacent frames often repeat the same action text, so only encode
+        # actions that are not already in the action embedding cache
+        action_cache = self._action_emb_cache
+        known = {}
+        for desc in action_descriptions:
+            if desc not in known and desc in action_cache:
+                action_cache.move_to_end(desc)
+                known[desc] = action_cache[desc]
+        new_descriptions = list(dict.fromkeys(d for d in action_descriptions if d not in known))
+        
+        if sop_embeddings is None:
+            # encode() sorts its inputs by length before batching, so passing
+            # both lists together keeps padding per batch to a minimum
+            embeddings = self.model.encode(
+                sop_descriptions + new_descriptions,
+                convert_to_tensor=True,
+                normalize_embeddings=True,
+                batch_size=ENCODE_BATCH_SIZE,
+                show_progress_bar=False
             )
-            
-            # Check safety equipment
-            safety_check = self.check_safety_equipment(
-                action_data.get("safety_equipment", []),
-                sop.get("safety_equipment", [])
+            sop_embeddings = embeddings[:len(sop_descriptions)].clone()
+            new_embeddings = embeddings[len(sop_descriptions):]
+            self._store_sop_embeddings(cache_key, sop_embeddings)
+        elif new_descriptions:
+            new_embeddings = self.model.encode(
+                new_descriptions,
+                convert_to_tensor=True,
+                normalize_embeddings=True,
+                batch_size=ENCODE_BATCH_SIZE,
+                show_progress_bar=False
             )
+        else:
+            new_embeddings = ()
+        
+        for desc, embedding in zip(new_descriptions, new_embeddings):
+            # Clone so a cached row doesn't keep the whole batch tensor alive
+            known[desc] = action_cache[desc] = embedding.clone()
+        while len(action_cache) > ACTION_CACHE_SIZE:
+            action_cache.popitem(last=False)
+        action_embeddings = torch.stack([known[desc] for desc in action_descriptions])
+        
+        best_indices, best_scores = self._best_matches(action_embeddings, sop_embeddings)
+        
+        # Lowercase the SOP-side tool and equipment lists once, not per action
+        step_tools_lower = []
+        for step in sop_steps:
+            tools_lower = [tool.lower() for tool in step.get("required_tools", [])]
+            step_tools_lower.append((tools_lower, set(tools_lower)))
+        required_safety_lower = [eq.lower() for eq in sop.get("safety_equipment", [])]
+        
+        for i, action_data in enumerate(video_actions):
+            action_desc = action_descriptions[i]
+            timestamp = action_data.get("timestamp", 0)
             
-            # Determine if this is a deviation
-            is_deviation = (
-                similarity < self.threshold or
-                not tool_check["is_compliant"] or
-                not safety_check["is_compliant"]
-            )
+            # Best matching SOP step from the batched similarity matrix
+            step_idx = best_indices[i]
+            similarity = best_scores[i]
+            matched_step = sop_steps[step_idx]
             
-            # Determine severity
-            if similarity < 0.5:
-                severity = "high"
-            elif similarity < self.threshold:
-                severity = "medium"
-            elif not safety_check["is_compliant"]:
+            if self.lazy_checks and similarity < HIGH_SEVERITY_SIMILARITY and similarity < self.threshold:
+                # Already a high-severity deviation on similarity alone, so
+                # skip the tool/safety checks (reported as None)
+                tool_check = None
+                safety_check = None
+                is_deviation = True
                 severity = "high"
-            elif not tool_check["is_compliant"]:
-                severity = "medium"
             else:
-                severity = "low"
+                # Check tool compliance
+                required_tools_lower, required_tools_set = step_tools_lower[step_idx]
+                tool_check = self._check_tools_lowered(
+                    [tool.lower() for tool in action_data.get("tools_visible", [])],
+                    required_tools_lower,
+                    required_tools_set
+                )
+                
+                # Check safety equipment
+                safety_check = self._check_safety_lowered(
+                    [eq.lower() for eq in action_data.get("safety_equipment", [])],
+                    required_safety_lower
+                )
+                
+                # Determine if this is a deviation
+                is_deviation = (
+                    similarity < self.threshold or
+                    not tool_check["is_compliant"] or
+                    not safety_check["is_compliant"]
+                )
+                
+                # Determine severity
+                if similarity < HIGH_SEVERITY_SIMILARITY:
+                    severity = "high"
+                elif similarity < self.threshold:
+                    severity = "medium"
+                elif not safety_check["is_compliant"]:
+                    severity = "high"
+                elif not tool_check["is_compliant"]:
+                    severity = "medium"
+                else:
+                    severity = "low"
             
             result = {
                 "frame_number": i,
@@ -218,7 +586,7 @@ class SOPComparator:
                 "potential_hazards": action_data.get("potential_hazards", [])
             }
             
-            results.append(result)
+            results.add(result)
             
             # Print real-time feedback
             status_icon = "❌" if is_deviation else "✅"
@@ -237,25 +605,57 @@ class SOPComparator:
             Dictionary with summary statistics
         """
         total_frames = len(compliance_results)
-        deviations = [r for r in compliance_results if r["is_deviation"]]
-        high_severity = [r for r in deviations if r["severity"] == "high"]
-        medium_severity = [r for r in deviations if r["severity"] == "medium"]
         
-        avg_similarity = sum(r["similarity_score"] for r in compliance_results) / total_frames if total_frames > 0 else 0
+        if isinstance(compliance_results, ComplianceResults):
+            # Vectorized reductions over the columns from analyze_sequence
+            is_deviation = compliance_results.is_deviation
+            deviation_severity = compliance_results.severity[is_deviation]
+            deviation_count = int(np.count_nonzero(is_deviation))
+            high_count = int(np.count_nonzero(deviation_severity == 2))
+            medium_count = int(np.count_nonzero(deviation_severity == 1))
+            tool_violations = int(np.count_nonzero(compliance_results.tool_violation))
+            safety_violations = int(np.count_nonzero(compliance_results.safety_violation))
+            similarity_sum = float(compliance_results.similarity.sum())
+            deviation_timestamps = [compliance_results[i]["timestamp"] for i in np.flatnonzero(is_deviation)]
+        else:
+            deviation_count = 0
+            high_count = 0
+            medium_count = 0
+            tool_violations = 0
+            safety_violations = 0
+            similarity_sum = 0
+            deviation_timestamps = []
+            
+            # Single pass over the results
+            for r in compliance_results:
+                similarity_sum += r["similarity_score"]
+                tool_check = r["tool_compliance"]
+                if tool_check is not None and not tool_check["is_compliant"]:
+                    tool_violations += 1
+                safety_check = r["safety_compliance"]
+                if safety_check is not None and not safety_check["is_compliant"]:
+                    safety_violations += 1
+                if r["is_deviation"]:
+                    deviation_count += 1
+                    severity = r["severity"]
+                    if severity == "high":
+                        high_count += 1
+                    elif severity == "medium":
+                        medium_count += 1
+                    deviation_timestamps.append(r["timestamp"])
         
-        tool_violations = sum(1 for r in compliance_results if not r["tool_compliance"]["is_compliant"])
-        safety_violations = sum(1 for r in compliance_results if not r["safety_compliance"]["is_compliant"])
+        avg_similarity = similarity_sum / total_frames if total_frames > 0 else 0
         
         return {
             "total_frames_analyzed": total_frames,
-            "total_deviations": len(deviations),
-            "high_severity_count": len(high_severity),
-            "medium_severity_count": len(medium_severity),
-            "compliance_rate": round((total_frames - len(deviations)) / total_frames * 100, 1) if total_frames > 0 else 0,
+            "total_deviations": deviation_count,
+            "high_severity_count": high_count,
+            "medium_severity_count": medium_count,
+            "compliance_rate": round((total_frames - deviation_count) / total_frames * 100, 1) if total_frames > 0 else 0,
             "average_similarity": round(avg_similarity, 3),
             "tool_violations": tool_violations,
             "safety_violations": safety_violations,
-            "deviation_timestamps": [r["timestamp"] for r in deviations]
+            "deviation_timestamps": deviation_timestamps
         }
 
 
@@ -9,12 +9,18 @@ from pathlib import Path
 # Add src to path
 sys.path.append(str(Path(__file__).parent.parent / "src"))
 
+import sop_comparator
 from sop_comparator import SOPComparator
 
 
 class TestSOPComparator:
     """Test cases for the SOP Comparator."""
     
+    @pytest.fixture(autouse=True)
+    def isolated_sop_cache(self, tmp_path, monkeypatch):
+        """Keep cached SOP embeddings out of the user's home directory."""
+        monkeypatch.setattr(sop_comparator, "SOP_CACHE_DIR", tmp_path)
+    
     @pytest.fixture
     def comparator(self):
         """Create a SOPComparator instance for testing."""
@@ -53,6 +59,17 @@ class TestSOPComparator:
         
         assert similarity > 0.95, "Identical texts should have very high similarity"
     
+    def test_compute_similarity_identical_quantized(self, monkeypatch):
+        """Test int8-quantized model still scores identical texts highly."""
+        monkeypatch.setenv("QUANTIZE", "1")
+        quantized = SOPComparator()
+        if not quantized.quantized:
+            pytest.skip("Quantization only applies to the CPU PyTorch backend")
+        
+        text = "Measure wall dimensions with tape measure"
+        
+        assert quantized.compute_similarity(text, text) > 0.95
+    
     def test_compute_similarity_similar(self, comparator):
         """Test similarity computation with similar texts."""
         text1 = "Measure wall dimensions with tape measure"
@@ -149,6 +166,90 @@ class TestSOPComparator:
         assert results[0]["is_deviation"] == False  # First action should be compliant
         # Second action might be deviation due to missing safety glasses
     
+    def test_analyze_sequence_matches_find_best_match(self, comparator, sample_sop):
+        """Test batched matching agrees with per-action find_best_match."""
+        video_actions = [
+            {"timestamp": 5.0, "worker_action": "Worker measuring wall with tape measure"},
+            {"timestamp": 10.0, "worker_action": "Worker cutting material with saw"},
+            {"timestamp": 15.0, "worker_action": "Worker measuring the wall with a tape"}
+        ]
+        
+        results = comparator.analyze_sequence(video_actions, sample_sop)
+        
+        for action, result in zip(video_actions, results):
+            idx, score, _ = comparator.find_best_match(action["worker_action"], sample_sop["steps"])
+            assert result["step_number"] == idx + 1
+            assert result["similarity_score"] == pytest.approx(score, abs=1e-3)
+    
+    def test_analyze_sequence_reuses_sop_embeddings(self, comparator, sample_sop, tmp_path):
+        """Test SOP step embeddings are cached in memory and on disk."""
+        video_actions = [{"timestamp": 5.0, "worker_action": "Worker measuring wall with tape measure"}]
+        
+        first = comparator.analyze_sequence(video_actions, sample_sop)
+        assert len(comparator._sop_cache) == 1
+        assert len(list(tmp_path.glob("*.pt"))) == 1
+        
+        # A fresh comparator picks the embeddings up from disk
+        fresh = SOPComparator(comparator.model_name)
+        second = fresh.analyze_sequence(video_actions, sample_sop)
+        assert len(fresh._sop_cache) == 1
+        assert second[0]["step_number"] == first[0]["step_number"]
+        assert second[0]["similarity_score"] == pytest.approx(first[0]["similarity_score"], abs=1e-3)
+    
+    def test_analyze_sequence_reuses_action_embeddings(self, comparator, sample_sop):
+        """Test repeated action texts are only encoded once."""
+        video_actions = [
+            {"timestamp": 5.0, "worker_action": "Worker measuring wall with tape measure"},
+            {"timestamp": 10.0, "worker_action": "Worker measuring wall with tape measure"},
+            {"timestamp": 15.0, "worker_action": "Worker cutting material with saw"}
+        ]
+        first = comparator.analyze_sequence(video_actions, sample_sop)
+        assert len(comparator._action_emb_cache) == 2
+        
+        encoded = []
+        encode = comparator.model.encode
+        comparator.model.encode = lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs)
+        second = comparator.analyze_sequence(video_actions, sample_sop)
+        
+        assert encoded == []
+        assert [r["step_number"] for r in second] == [r["step_number"] for r in first]
+        assert [r["similarity_score"] for r in second] == pytest.approx([r["similarity_score"] for r in first])
+    
+    def test_analyze_sequence_lazy_checks(self, comparator, sample_sop):
+        """Test checks are skipped for clearly off-procedure frames."""
+        comparator.lazy_checks = True
+        video_actions = [
+            {"timestamp": 5.0, "worker_action": "Worker eating lunch on a bench",
+             "tools_visible": ["sandwich"], "safety_equipment": []}
+        ]
+        
+        results = comparator.analyze_sequence(video_actions, sample_sop)
+        summary = comparator.generate_summary(results)
+        
+        assert results[0]["similarity_score"] < 0.5
+        assert results[0]["is_deviation"] == True
+        assert results[0]["severity"] == "high"
+        assert results[0]["tool_compliance"] is None
+        assert summary["tool_violations"] == 0
+    
+    def test_generate_summary_columns_match_dicts(self, comparator, sample_sop):
+        """Test numpy-column summary agrees with the plain-dict summary."""
+        video_actions = [
+            {"timestamp": 5.0, "worker_action": "Worker measuring wall with tape measure",
+             "tools_visible": ["tape measure"], "safety_equipment": ["hard hat", "safety glasses"]},
+            {"timestamp": 10.0, "worker_action": "Worker cutting material with saw",
+             "tools_visible": ["hammer"], "safety_equipment": ["hard hat"]},
+            {"timestamp": 15.0, "worker_action": "Worker eating lunch on a bench"}
+        ]
+        
+        results = comparator.analyze_sequence(video_actions, sample_sop)
+        
+        assert comparator.generate_summary(results) == comparator.generate_summary(list(results))
+    
+    def test_analyze_sequence_empty(self, comparator, sample_sop):
+        """Test analyzing an empty action list."""
+        assert comparator.analyze_sequence([], sample_sop) == []
+    
     def test_generate_summary(self, comparator):
         """Test summary generation."""
         compliance_results = [
@@ -0,0 +1,212 @@
+"""
+Tests for Video Analyzer
+"""
+
+import numpy as np
+import pytest
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+import video_analyzer
+from video_analyzer import ExtractedFrames, VideoAnalyzer, frame_phash, hamming_distance, parse_json_response
+
+
+class TestParseJsonResponse:
+    """Test cases for parsing model responses."""
+    
+    def test_fenced(self):
+        """Test a ```json fenced response is unwrapped."""
+        assert parse_json_response('```json\n{"a": 1}\n```') == {"a": 1}
+        assert parse_json_response('```\n[1, 2]\n```\n') == [1, 2]
+    
+    def test_no_fence(self):
+        """Test a bare JSON response is parsed as is."""
+        assert parse_json_response('  {"a": 1}\n') == {"a": 1}
+    
+    def test_unclosed_fence(self):
+        """Test a response cut off before the closing fence is still unwrapped."""
+        assert parse_json_response('```json\n{"a": 1}\n') == {"a": 1}
+    
+    def test_leading_prose(self):
+        """Test text before the fenced block is ignored."""
+        assert parse_json_response('Here is the analysis:\n```json\n{"a": 1}\n```') == {"a": 1}
+
+
+class TestExtractedFrames:
+    """Test cases for the packed frame columns."""
+    
+    @pytest.fixture
+    def frames(self):
+        """Three frames with distinct JPEG payloads."""
+        jpegs = [b"\xff\xd8first", b"\xff\xd8second", b"\xff\xd8third"]
+        offsets = [0]
+        for jpeg in jpegs:
+            offsets.append(offsets[-1] + len(jpeg))
+        return ExtractedFrames(
+            frame_numbers=[0, 15, 30],
+            timestamps=[0.0, 0.5, 1.0],
+            phashes=[1, 2, 3],
+            jpeg_data=bytearray(b"".join(jpegs)),
+            offsets=offsets
+        )
+    
+    def test_getitem_index(self, frames):
+        """Test integer indexing, including negative indices."""
+        assert len(frames) == 3
+        assert frames[1] == {"frame_number": 15, "timestamp": 0.5, "jpeg": b"\xff\xd8second", "phash": 2}
+        assert frames[-1]["jpeg"] == b"\xff\xd8third"
+        with pytest.raises(IndexError):
+            frames[3]
+    
+    def test_getitem_slice(self, frames):
+        """Test slicing returns the matching frame dicts."""
+        assert frames[1:] == list(frames)[1:]
+        assert [f["frame_number"] for f in frames[::2]] == [0, 30]
+        assert [f["timestamp"] for f in frames[::-1]] == [1.0, 0.5, 0.0]
+        assert frames[5:] == []
+
+
+
+class TestFrameHash:
+    """Test cases for perceptual hashing."""
+    
+    @pytest.fixture
+    def gray(self):
+        """A noisy gradient frame."""
+        rng = np.random.default_rng(0)
+        gradient = np.add.outer(np.arange(120), np.arange(160)).astype(np.float64)
+        return np.clip(gradient + rng.normal(0, 20, gradient.shape), 0, 255).astype(np.uint8)
+    
+    def test_hamming_distance(self):
+        """Test differing bits are counted, including the top bit of 64-bit hashes."""
+        assert hamming_distance(0, 0) == 0
+        assert hamming_distance(0b1011, 0b0001) == 2
+        assert hamming_distance(1 << 63, 0) == 1
+        assert hamming_distance(2 ** 64 - 1, 0) == 64
+    
+    def test_numba_kernel_matches_cv2_dct(self, gray, monkeypatch):
+        """Test the Numba kernel and the cv2.dct fallback produce the same hash."""
+        if video_analyzer._phash_kernel is None:
+            pytest.skip("numba is not installed")
+        numba_hash = frame_phash(gray)
+        monkeypatch.setattr(video_analyzer, "_phash_kernel", None)
+        assert frame_phash(gray) == numba_hash
+
+
+class FakeFrame:
+    """Stand-in for LazyFrame with a fixed hash and JPEG."""
+    
+    def __init__(self, frame_number, timestamp, phash, jpeg=b"\xff\xd8"):
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+        self._phash = phash
+        self._jpeg = jpeg
+    
+    def phash(self):
+        return self._phash
+    
+    def encode(self):
+        return self._jpeg
+
+
+class TestIterAnalyzeVideo:
+    """Test cases for the threaded frame analysis pipeline."""
+    
+    @pytest.fixture
+    def analyzer(self):
+        """Analyzer with two workers, two frames per request and no rate limiting to speak of."""
+        return VideoAnalyzer(api_key="test-key", max_concurrency=2, requests_per_minute=60000,
+                             frame_batch_size=2)
+    
+    @staticmethod
+    def use_frames(analyzer, frames, closed=None):
+        """Make the analyzer read the given frames instead of a video."""
+        def iter_lazy_frames(video_path, frame_rate):
+            try:
+                yield from frames
+            finally:
+                if closed is not None:
+                    closed.set()
+        analyzer.iter_lazy_frames = iter_lazy_frames
+    
+    def test_results_in_frame_order(self, analyzer):
+        """Test results are yielded in frame order when batches finish out of order."""
+        self.use_frames(analyzer, [FakeFrame(i, float(i), i << 16) for i in range(6)])
+        
+        def analyze_frames(frames):
+            # The first batch finishes last
+            if frames[0]["timestamp"] == 0.0:
+                time.sleep(0.2)
+            return [{"worker_action": f"frame {f['frame_number']}"} for f in frames]
+        analyzer.analyze_frames = analyze_frames
+        
+        results = list(analyzer.iter_analyze_video("video.mp4", dedupe_threshold=0))
+        assert [r["worker_action"] for r in results] == [f"frame {i}" for i in range(6)]
+    
+    def test_duplicate_and_dropped_frames(self, analyzer):
+        """Test duplicates reuse the last analysis and undecodable frames are skipped."""
+        self.use_frames(analyzer, [
+            FakeFrame(0, 0.0, 0),
+            FakeFrame(1, 1.0, 0b1),  # duplicate of frame 0
+            FakeFrame(2, 2.0, 0xFF00, jpeg=None),  # fails to encode
+            FakeFrame(3, 3.0, 0xFFFF0000)
+        ])
+        sent = []
+        
+        def analyze_frames(frames):
+            sent.extend(f["frame_number"] for f in frames)
+            return [{"worker_action": f"frame {f['frame_number']}", "timestamp": f["timestamp"]} for f in frames]
+        analyzer.analyze_frames = analyze_frames
+        
+        results = list(analyzer.iter_analyze_video("video.mp4", dedupe_threshold=5))
+        assert sent == [0, 3]
+        assert [(r["worker_action"], r["timestamp"]) for r in results] == [
+            ("frame 0", 0.0), ("frame 0", 1.0), ("frame 3", 3.0)
+        ]
+    
+    def test_failed_batch_yields_error_results(self, analyzer):
+        """Test an unexpected error in one batch doesn't cut later frames from the output."""
+        self.use_frames(analyzer, [FakeFrame(i, float(i), i << 16) for i in range(6)])
+        
+        def analyze_frames(frames):
+            if frames[0]["timestamp"] == 2.0:
+                raise RuntimeError("boom")
+            return [{"worker_action": f"frame {f['frame_number']}"} for f in frames]
+        analyzer.analyze_frames = analyze_frames
+        
+        results = list(analyzer.iter_analyze_video("video.mp4", dedupe_threshold=0))
+        assert len(results) == 6
+        assert [r.get("error") for r in results] == [None, None, "boom", "boom", None, None]
+        assert results[5]["worker_action"] == "frame 5"
+    
+    def test_close_stops_threads(self, analyzer):
+        """Test closing the iterator early stops the reader and workers."""
+        closed = threading.Event()
+        self.use_frames(analyzer, (FakeFrame(i, float(i), i << 16) for i in range(1000)), closed)
+        calls = []
+        
+        def analyze_frames(frames):
+            calls.append(frames)
+            time.sleep(0.01)
+            return [{"worker_action": f"frame {f['frame_number']}"} for f in frames]
+        analyzer.analyze_frames = analyze_frames
+        
+        threads_before = threading.active_count()
+        results = analyzer.iter_analyze_video("video.mp4", dedupe_threshold=0)
+        assert next(results)["worker_action"] == "frame 0"
+        results.close()
+        
+        assert threading.active_count() == threads_before
+        assert closed.is_set()
+        sent = len(calls)
+        time.sleep(0.1)
+        assert len(calls) == sent < 500
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
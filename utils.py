@@ -3,11 +3,28 @@ Utility Functions
 Helper functions for the Construction Safety Monitor.
 """
 
+import copy
 import os
+import sys
 import json
+import time
+from functools import lru_cache
 from typing import Dict, List
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
+
+# Below this many scores, calculate_statistics uses the stdlib instead of numpy
+_NUMPY_STATS_MIN_SIZE = 32
+
+# Minimum seconds between progress bar redraws, and (tenths_of_percent, time) of the last one
+_PROGRESS_MIN_INTERVAL = 0.033
+_last_progress = (-1, 0.0)
+
 
 def format_time(seconds: float) -> str:
     """
@@ -29,18 +46,39 @@ def format_time(seconds: float) -> str:
         return f"{minutes:02d}:{secs:02d}"
 
 
+@lru_cache(maxsize=32)
+def _load_json_cached(filepath: str, mtime_ns: int) -> Dict:
+    """
+    Parse a JSON file; mtime_ns is part of the cache key.
+    
+    Args:
+        filepath: Path to the JSON file
+        mtime_ns: File modification time, so edits invalidate the cache
+        
+    Returns:
+        Parsed JSON data
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def load_json_file(filepath: str) -> Dict:
     """
     Load and parse a JSON file.
     
+    Repeated loads of an unchanged file are served from a parse cache.
+    
     Args:
         filepath: Path to the JSON file
         
     Returns:
-        Parsed JSON data as dictionary
+        Parsed JSON data as dictionary (a copy the caller may modify)
     """
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    filepath = os.fspath(filepath)
+    return copy.deepcopy(_load_json_cached(filepath, os.stat(filepath).st_mtime_ns))
 
 
 def save_json_file(data: Dict, filepath: str):
@@ -52,8 +90,12 @@ def save_json_file(data: Dict, filepath: str):
         filepath: Output file path
     """
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(data, indent=2).encode("utf-8")
+    with open(filepath, 'wb') as f:
+        f.write(payload)
 
 
 def create_output_directory(base_path: str = "results") -> str:
@@ -85,6 +127,19 @@ def get_video_duration(video_path: str) -> float:
     Returns:
         Video duration in seconds
     """
+    # Container headers via PyAV are much cheaper than opening the codec with OpenCV
+    try:
+        import av
+        
+        with av.open(video_path) as container:
+            stream = container.streams.video[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+            if container.duration is not None:
+                return container.duration / av.time_base
+    except Exception:
+        pass  # PyAV not installed or no usable duration; fall back to OpenCV
+    
     import cv2
     
     cap = cv2.VideoCapture(video_path)
@@ -131,14 +186,29 @@ def calculate_statistics(scores: List[float]) -> Dict:
             "std": 0
         }
     
+    # Small lists (the common case) are cheaper to summarize without numpy
+    if len(scores) < _NUMPY_STATS_MIN_SIZE:
+        import statistics
+        
+        mean = statistics.fmean(scores)
+        return {
+            "mean": float(mean),
+            "median": float(statistics.median(scores)),
+            "min": float(min(scores)),
+            "max": float(max(scores)),
+            "std": float(statistics.pstdev(scores, mean))
+        }
+    
     import numpy as np
     
+    # Convert once instead of once per reduction
+    a = np.asarray(scores, dtype=np.float64)
     return {
-        "mean": float(np.mean(scores)),
-        "median": float(np.median(scores)),
-        "min": float(np.min(scores)),
-        "max": float(np.max(scores)),
-        "std": float(np.std(scores))
+        "mean": float(a.mean()),
+        "median": float(np.median(a)),
+        "min": float(a.min()),
+        "max": float(a.max()),
+        "std": float(a.std())
     }
 
 
@@ -153,14 +223,26 @@ def print_progress_bar(iteration: int, total: int, prefix: str = "", suffix: str
         suffix: Suffix string
         length: Character length of bar
     """
+    global _last_progress
+    
+    # Redraw at most every 0.1% and ~30 times per second; always draw the
+    # first and last iterations
+    tenths = 1000 * iteration // total
+    now = time.monotonic()
+    last_tenths, last_time = _last_progress
+    if 0 < iteration < total and (tenths == last_tenths or now - last_time < _PROGRESS_MIN_INTERVAL):
+        return
+    _last_progress = (tenths, now)
+    
     percent = f"{100 * (iteration / float(total)):.1f}"
     filled_length = int(length * iteration // total)
     bar = "█" * filled_length + "-" * (length - filled_length)
     
-    print(f"\r{prefix} |{bar}| {percent}% {suffix}", end="\r")
-    
+    line = f"\r{prefix} |{bar}| {percent}% {suffix}\r"
     if iteration == total:
-        print()
+        line += "\n"
+    sys.stdout.write(line)
+    sys.stdout.flush()
 
 
 if __name__ == "__main__":
@@ -177,7 +259,6 @@ if __name__ == "__main__":
     print(f"Statistics: {stats}")
     
     # Test progress bar
-    import time
     for i in range(101):
         print_progress_bar(i, 100, prefix="Progress:", suffix="Complete")
         time.sleep(0.02)
@@ -4,134 +4,839 @@ Analyzes construction videos and extracts action descriptions using AI vision mo
 """
 
 import cv2
+import hashlib
+import importlib.util
+import io
 import os
 import json
-from typing import List, Dict, Optional
+import mmap
+import queue
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Iterator, Optional, Union
 from pathlib import Path
+import numpy as np
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import client as genai_client
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 import time
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # frame_phash falls back to cv2.dct
+    njit = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo_jpeg = TurboJPEG()
+except Exception:  # package or libturbojpeg missing; encode_jpeg uses cv2.imencode
+    _turbo_jpeg = None
+
 load_dotenv()
 
+# FourCC codes of H.265/HEVC streams, which OpenCV decodes slowly on CPU
+_HEVC_FOURCCS = {"hevc", "hev1", "hvc1", "h265", "x265"}
+
+JPEG_QUALITY = 80
+
+# Frames are downscaled to this longest edge; Gemini resizes larger images anyway
+MAX_FRAME_EDGE = 1024
+
+# Default frame decoder: "cv2", "pyav" or "nvdec" (the last two need PyAV)
+VIDEO_DECODER = os.getenv("VIDEO_DECODER", "cv2")
+
+# Request raw I420 frames from OpenCV (CAP_PROP_CONVERT_RGB=0) so the dedup hash
+# reads the Y plane and only encoded frames are converted to BGR
+RAW_YUV_DECODE = os.getenv("RAW_YUV_DECODE", "0") == "1"
+
+# Downscale frames with OpenCL (cv2.UMat) when a device is available
+USE_OPENCL = os.getenv("USE_OPENCL", "0") == "1"
+
+FRAME_PROMPT = """
+Analyze this construction site image and provide detailed information in JSON format:
+
+{
+    "worker_action": "Detailed description of what the worker is doing",
+    "tools_visible": ["list", "of", "tools"],
+    "safety_equipment": ["list", "of", "safety", "gear"],
+    "location_zone": "area where worker is located",
+    "potential_hazards": ["list", "of", "visible", "hazards"],
+    "action_category": "measuring/cutting/installing/securing/finishing"
+}
+
+Focus on:
+1. Specific actions being performed
+2. Tools and equipment in use
+3. Safety equipment worn by workers
+4. Work area and positioning
+5. Any safety concerns
+
+Respond ONLY with valid JSON, no other text.
+"""
+
+BATCH_FRAME_PROMPT = """
+The following images are frames from one construction site video, each followed
+by its frame index and timestamp. Analyze every frame and provide detailed
+information in JSON format:
+
+{
+    "frames": [
+        {
+            "idx": 0,
+            "worker_action": "Detailed description of what the worker is doing",
+            "tools_visible": ["list", "of", "tools"],
+            "safety_equipment": ["list", "of", "safety", "gear"],
+            "location_zone": "area where worker is located",
+            "potential_hazards": ["list", "of", "visible", "hazards"],
+            "action_category": "measuring/cutting/installing/securing/finishing"
+        }
+    ]
+}
+
+Return exactly one entry per frame, with "idx" set to the frame index.
+
+Focus on:
+1. Specific actions being performed
+2. Tools and equipment in use
+3. Safety equipment worn by workers
+4. Work area and positioning
+5. Any safety concerns
+
+Respond ONLY with valid JSON, no other text.
+"""
+
+VIDEO_PROMPT = """
+Analyze this construction work video comprehensively. Provide a timeline of worker actions in JSON format:
+
+{
+    "actions": [
+        {
+            "timestamp_start": 0.0,
+            "timestamp_end": 5.0,
+            "worker_action": "Worker measuring wall with tape measure",
+            "tools_visible": ["tape measure"],
+            "safety_equipment": ["hard hat", "safety vest"],
+            "location_zone": "main work area",
+            "action_category": "measuring"
+        }
+    ],
+    "overall_summary": "Brief summary of the entire video",
+    "compliance_notes": "Any notable safety or procedural observations"
+}
+
+For each distinct action segment in the video:
+- Note the time range
+- Describe the specific action
+- List tools and equipment
+- Identify the work zone
+- Categorize the action type
+
+Respond ONLY with valid JSON.
+"""
+
+# Cache the uploaded video and timeline prompt server-side for repeat direct analyses
+USE_CONTEXT_CACHE = os.getenv("USE_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL = timedelta(hours=1)
+
+# Seconds before a Gemini request is abandoned (whole-video requests take longer)
+REQUEST_TIMEOUT = 60
+VIDEO_REQUEST_TIMEOUT = 600
+
+# Images larger than this go through the Files API instead of inline request data
+INLINE_IMAGE_LIMIT = 20 * 1024 * 1024
+
+# Frames whose perceptual hash differs from the last analyzed frame in fewer
+# bits than this reuse that frame's analysis. Off by default: a small change
+# such as a worker taking off safety glasses can fall under the threshold
+DEDUPE_THRESHOLD = int(os.getenv("DEDUPE_THRESHOLD", 0))
+
+# Uploaded videos are reused only if they stay valid at least this much longer
+UPLOAD_EXPIRY_MARGIN = timedelta(minutes=5)
+
+# Contents of a ```json ... ``` (or bare ```) fenced block in a model response;
+# the closing fence may be missing when the output was cut off
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|$)", re.S)
+
+
+def parse_json_response(response_text: str):
+    """
+    Parse a model response as JSON, unwrapping a markdown code fence if present.
+    
+    Args:
+        response_text: Raw response text
+        
+    Returns:
+        Parsed JSON value
+        
+    Raises:
+        json.JSONDecodeError: If the payload is not valid JSON
+            (orjson.JSONDecodeError is a subclass)
+    """
+    match = _FENCE_RE.search(response_text)
+    payload = match.group(1) if match else response_text.strip()
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+# Orthonormal DCT-II basis rows for the 8 lowest frequencies of a 32-point signal
+# (same scaling as cv2.dct)
+_DCT_BASIS = (np.cos((2 * np.arange(32) + 1) * np.arange(8)[:, None] * np.pi / 64)
+              * np.where(np.arange(8)[:, None] == 0, np.sqrt(1 / 32), np.sqrt(2 / 32)))
+
+if njit is not None:
+    @njit(cache=True, nogil=True, fastmath=True)
+    def _phash_kernel(small, basis):
+        """Hash bits of the 8x8 low-frequency DCT block of a 32x32 image."""
+        rows = np.zeros((8, 32))
+        for u in range(8):
+            for x in range(32):
+                bu = basis[u, x]
+                for y in range(32):
+                    rows[u, y] += bu * small[x, y]
+        low = np.zeros(64)
+        for u in range(8):
+            for v in range(8):
+                acc = 0.0
+                for y in range(32):
+                    acc += rows[u, y] * basis[v, y]
+                low[u * 8 + v] = acc
+        median = np.median(low)
+        h = np.uint64(0)
+        for i in range(64):
+            if low[i] > median:
+                h |= np.uint64(1) << np.uint64(63 - i)
+        return h
+else:
+    _phash_kernel = None
+
+
+def frame_phash(gray: np.ndarray) -> int:
+    """
+    Compute a 64-bit DCT perceptual hash of a grayscale frame.
+    
+    Uses a Numba kernel (which releases the GIL) when numba is installed.
+    
+    Args:
+        gray: Single-channel uint8 image
+        
+    Returns:
+        Hash as an integer; compare hashes with hamming_distance
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    if _phash_kernel is not None:
+        return int(_phash_kernel(small, _DCT_BASIS))
+    low = cv2.dct(small)[:8, :8]
+    bits = (low > np.median(low)).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = JPEG_QUALITY) -> Optional[bytes]:
+    """
+    JPEG-encode a BGR frame, with libjpeg-turbo (SIMD) when PyTurboJPEG is installed.
+    
+    Args:
+        frame: BGR uint8 image
+        quality: JPEG quality (0-100)
+        
+    Returns:
+        JPEG bytes, or None if encoding failed
+    """
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+# Rate-limit (429) and transient server errors worth retrying
+_RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+)
+
+_backoff = wait_exponential_jitter(initial=0.5, max=30)
+
+
+def _retry_wait(retry_state) -> float:
+    """Wait for the server's Retry-After if it sent one, else exponential backoff with jitter."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return min(float(headers["Retry-After"]), 60.0)
+    except (KeyError, TypeError, ValueError):
+        return _backoff(retry_state)
+
+
+@retry(wait=_retry_wait, retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+       stop=stop_after_attempt(6), reraise=True)
+def generate_with_retry(model, contents, timeout: float):
+    """
+    Call model.generate_content, backing off and retrying on rate limits and 5xx errors.
+    
+    Args:
+        model: Gemini GenerativeModel
+        contents: Request contents
+        timeout: Per-attempt timeout in seconds
+        
+    Returns:
+        Gemini response
+    """
+    return model.generate_content(contents, request_options={"timeout": timeout})
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _error_analysis(timestamp: float, error: Exception) -> Dict:
+    """Placeholder analysis for a frame whose request failed."""
+    return {
+        "timestamp": timestamp,
+        "worker_action": "Error in analysis",
+        "tools_visible": [],
+        "safety_equipment": [],
+        "location_zone": "unknown",
+        "potential_hazards": [],
+        "action_category": "unknown",
+        "error": str(error)
+    }
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `requests_per_minute` calls per minute."""
+    
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        """
+        Initialize the rate limiter.
+        
+        Args:
+            requests_per_minute: Steady-state request rate
+            burst: Number of requests that may be issued back to back
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be issued."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A negative balance reserves a future slot for this caller
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _VideoSource:
+    """
+    A video file opened once and shared by frame extraction and whole-file upload.
+    
+    capture() returns one lazily opened cv2.VideoCapture (rewound on reuse);
+    bytes() memory-maps the file so hashing reads it without userspace copies.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Initialize the source; nothing is opened until first use.
+        
+        Args:
+            path: Path to the video file
+        """
+        self.path = path
+        self._cap = None
+        self._file = None
+        self._bytes = None
+        self._sha256 = None
+    
+    @classmethod
+    def wrap(cls, video: Union[str, "_VideoSource"]):
+        """
+        Return (source, owned): the given source, or a new one for a path that the caller must close.
+        
+        Args:
+            video: Path to the video file or an existing _VideoSource
+        """
+        if isinstance(video, cls):
+            return video, False
+        return cls(video), True
+    
+    def capture(self):
+        """OpenCV capture positioned at the first frame."""
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.path)
+        else:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self._cap
+    
+    def bytes(self):
+        """Read-only memory map of the whole file."""
+        if self._bytes is None:
+            self._file = open(self.path, "rb")
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._bytes = b""  # empty files cannot be mapped
+            else:
+                self._bytes = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._bytes
+    
+    def sha256(self) -> str:
+        """Hex SHA-256 digest of the file contents (computed once)."""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.bytes()).hexdigest()
+        return self._sha256
+    
+    def close(self):
+        """Release the capture and the memory map."""
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        if isinstance(self._bytes, mmap.mmap):
+            self._bytes.close()
+        self._bytes = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ExtractedFrames:
+    """
+    Extracted frames stored as parallel numpy columns plus one JPEG buffer.
+    
+    Returned by VideoAnalyzer.extract_frames. JPEGs are packed back to back
+    in a single bytearray, with frame i spanning offsets[i]:offsets[i + 1].
+    Indexing or iterating yields the per-frame dicts of iter_frames.
+    """
+    
+    def __init__(self, frame_numbers: List[int], timestamps: List[float], phashes: List[int],
+                 jpeg_data: bytearray, offsets: List[int]):
+        """
+        Build the columns from values collected during extraction.
+        
+        Args:
+            frame_numbers: Index of each frame in the video
+            timestamps: Timestamp of each frame in seconds
+            phashes: Perceptual hash of each frame
+            jpeg_data: Concatenated JPEG bytes of all frames
+            offsets: Start offset of each frame in jpeg_data, plus the total length
+        """
+        self.frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.phashes = np.asarray(phashes, dtype=np.uint64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._jpeg_data = jpeg_data
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    
+    def jpeg_for(self, i: int) -> bytes:
+        """
+        JPEG bytes of frame i.
+        
+        Args:
+            i: Frame position
+            
+        Returns:
+            A copy of the frame's JPEG bytes, ready to send
+        """
+        return bytes(memoryview(self._jpeg_data)[self.offsets[i]:self.offsets[i + 1]])
+    
+    def __getitem__(self, i: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if not -len(self) <= i < len(self):
+            raise IndexError("frame index out of range")
+        i %= len(self)
+        return {
+            "frame_number": int(self.frame_numbers[i]),
+            "timestamp": float(self.timestamps[i]),
+            "jpeg": self.jpeg_for(i),
+            "phash": int(self.phashes[i])
+        }
+    
+    def __iter__(self) -> Iterator[Dict]:
+        return (self[i] for i in range(len(self)))
+
+
+class LazyFrame:
+    """
+    A sampled video frame whose pixels are decoded, resized and encoded only on demand.
+    
+    Only valid until the next frame is read from the same source.
+    """
+    
+    __slots__ = ("frame_number", "timestamp", "_retrieve", "_retrieve_gray",
+                 "_max_edge", "_use_umat", "_frame", "_thumb")
+    
+    def __init__(self, frame_number: int, timestamp: float, retrieve, retrieve_gray=None,
+                 max_edge: int = MAX_FRAME_EDGE, use_umat: bool = False):
+        """
+        Initialize the lazy frame.
+        
+        Args:
+            frame_number: Index of the frame in the video
+            timestamp: Timestamp of the frame in seconds
+            retrieve: Callable returning the decoded BGR frame (or None)
+            retrieve_gray: Optional callable returning the luma plane without a BGR conversion
+            max_edge: Longest edge of the encoded JPEG
+            use_umat: Downscale with OpenCL via cv2.UMat
+        """
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+        self._retrieve = retrieve
+        self._retrieve_gray = retrieve_gray
+        self._max_edge = max_edge
+        self._use_umat = use_umat
+        self._frame = None
+        self._thumb = None
+    
+    def decode(self) -> Optional[np.ndarray]:
+        """Decode the full-resolution BGR frame (once)."""
+        if self._frame is None:
+            self._frame = self._retrieve()
+        return self._frame
+    
+    def thumb(self) -> Optional[np.ndarray]:
+        """32x32 grayscale thumbnail for hashing, from the luma plane when available."""
+        if self._thumb is None:
+            if self._retrieve_gray is not None:
+                gray = self._retrieve_gray()
+            else:
+                frame = self.decode()
+                gray = None if frame is None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if gray is not None:
+                self._thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+        return self._thumb
+    
+    def phash(self) -> int:
+        """64-bit perceptual hash of the frame (0 if it cannot be decoded)."""
+        thumb = self.thumb()
+        return frame_phash(thumb) if thumb is not None else 0
+    
+    def encode(self) -> Optional[bytes]:
+        """
+        Downscale the frame to max_edge and JPEG-encode it.
+        
+        Returns:
+            JPEG bytes, or None if the frame could not be decoded or encoded
+        """
+        frame = self.decode()
+        if frame is None:
+            return None
+        # Downscale before encoding: encode cost and upload size scale with pixels
+        h, w = frame.shape[:2]
+        scale = self._max_edge / max(h, w)
+        if scale < 1.0:
+            if self._use_umat:
+                frame = cv2.resize(cv2.UMat(frame), None, fx=scale, fy=scale,
+                                   interpolation=cv2.INTER_AREA).get()
+            else:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return encode_jpeg(frame)
+
 
 class VideoAnalyzer:
     """Analyzes construction videos to extract worker actions and behaviors."""
     
-    def __init__(self, api_key: Optional[str] = None, model_name: str = "gemini-2.0-flash-exp"):
+    def __init__(self, api_key: Optional[str] = None, model_name: str = "gemini-2.0-flash-exp",
+                 max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None,
+                 frame_batch_size: Optional[int] = None):
         """
         Initialize the Video Analyzer.
         
         Args:
             api_key: Google Gemini API key (uses env var if not provided)
             model_name: Name of the Gemini model to use
+            max_concurrency: Maximum number of Gemini requests in flight
+            requests_per_minute: Gemini request quota to stay under
+            frame_batch_size: Number of frames sent per Gemini request in analyze_video
         """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
         genai.configure(api_key=self.api_key)
+        # Create the shared API clients up front: they hold one long-lived
+        # channel for every request, and worker threads would otherwise race
+        # to create (and handshake) their own on first use
+        genai_client.get_default_generative_client()
+        if hasattr(genai_client, "get_default_file_client"):
+            genai_client.get_default_file_client()
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+        rpm = requests_per_minute or float(os.getenv("GEMINI_RPM", 60))
+        self.rate_limiter = RateLimiter(rpm, burst=self.max_concurrency)
+        self.frame_batch_size = max(1, frame_batch_size or int(os.getenv("GEMINI_FRAME_BATCH", 1)))
+        # Encoded frame batches buffered ahead of the Gemini workers
+        self.prefetch = 2 * self.max_concurrency
+        # Files API handles of uploaded videos, keyed by content hash
+        self._upload_cache: Dict[str, object] = {}
+        self.use_context_cache = USE_CONTEXT_CACHE
+        # Context caches of uploaded videos, keyed by file name
+        self._context_cache: Dict[str, object] = {}
         
-    def extract_frames(self, video_path: str, frame_rate: int = 2) -> List[Dict]:
+    def extract_frames(self, video_path: Union[str, _VideoSource], frame_rate: int = 2, max_edge: int = MAX_FRAME_EDGE,
+                       decoder: str = VIDEO_DECODER) -> "ExtractedFrames":
         """
         Extract frames from video at specified intervals.
         
         Args:
             video_path: Path to the video file
             frame_rate: Extract one frame every N seconds
+            max_edge: Downscale frames so their longest edge is at most this many pixels
+            decoder: "cv2", "pyav" (multi-threaded libav) or "nvdec" (libav with CUDA decode)
             
         Returns:
-            List of dictionaries containing frame data and timestamps
+            ExtractedFrames holding timestamps, frame numbers and JPEG bytes
+        """
+        frame_numbers = []
+        timestamps = []
+        phashes = []
+        jpeg_data = bytearray()
+        offsets = [0]
+        for frame_data in self.iter_frames(video_path, frame_rate, max_edge, decoder):
+            frame_numbers.append(frame_data["frame_number"])
+            timestamps.append(frame_data["timestamp"])
+            phashes.append(frame_data["phash"])
+            jpeg_data += frame_data["jpeg"]
+            offsets.append(len(jpeg_data))
+        return ExtractedFrames(frame_numbers, timestamps, phashes, jpeg_data, offsets)
+    
+    def iter_frames(self, video_path: Union[str, _VideoSource], frame_rate: int = 2, max_edge: int = MAX_FRAME_EDGE,
+                    decoder: str = VIDEO_DECODER) -> Iterator[Dict]:
         """
-        frames_data = []
-        cap = cv2.VideoCapture(video_path)
+        Lazily extract frames from video at specified intervals.
+        
+        Args:
+            video_path: Path to the video file
+            frame_rate: Extract one frame every N seconds
+            max_edge: Downscale frames so their longest edge is at most this many pixels
+            decoder: "cv2", "pyav" (multi-threaded libav) or "nvdec" (libav with CUDA decode)
+            
+        Yields:
+            Dictionaries containing JPEG bytes and timestamps
+        """
+        extracted_count = 0
+        for frame in self.iter_lazy_frames(video_path, frame_rate, max_edge, decoder):
+            jpeg = frame.encode()
+            if jpeg is not None:
+                yield {
+                    "frame_number": frame.frame_number,
+                    "timestamp": frame.timestamp,
+                    "jpeg": jpeg,
+                    "phash": frame.phash()
+                }
+                extracted_count += 1
+        print(f"Extracted {extracted_count} frames")
+    
+    def iter_lazy_frames(self, video_path: Union[str, _VideoSource], frame_rate: int = 2,
+                         max_edge: int = MAX_FRAME_EDGE, decoder: str = VIDEO_DECODER) -> Iterator[LazyFrame]:
+        """
+        Yield sampled frames without decoding or encoding their pixels yet.
+        
+        Each LazyFrame is only valid until the next one is requested.
+        
+        Args:
+            video_path: Path to the video file, or a _VideoSource to reuse
+            frame_rate: Sample one frame every N seconds
+            max_edge: Longest edge of the encoded JPEG
+            decoder: "cv2", "pyav" (multi-threaded libav) or "nvdec" (libav with CUDA decode)
+            
+        Yields:
+            LazyFrame objects in video order
+        """
+        if decoder not in ("cv2", "pyav", "nvdec"):
+            raise ValueError(f"Unknown video decoder: {decoder}")
+        if decoder != "cv2" and importlib.util.find_spec("av") is None:
+            print(f"⚠️ PyAV is not installed; using OpenCV instead of the {decoder} decoder")
+            decoder = "cv2"
+        
+        use_umat = USE_OPENCL and cv2.ocl.haveOpenCL()
+        source, owned = _VideoSource.wrap(video_path)
+        
+        print(f"Extracting frames every {frame_rate} seconds from {source.path}...")
+        
+        try:
+            if decoder == "cv2":
+                sampled = self._decode_cv2(source, frame_rate)
+            else:
+                sampled = self._decode_pyav(source.path, frame_rate, hwaccel=decoder == "nvdec")
+            for frame_number, timestamp, retrieve, retrieve_gray in sampled:
+                yield LazyFrame(frame_number, timestamp, retrieve, retrieve_gray, max_edge, use_umat)
+        finally:
+            if owned:
+                source.close()
+    
+    def _decode_cv2(self, source: _VideoSource, frame_rate: int) -> Iterator[tuple]:
+        """
+        Sample one frame every frame_rate seconds with OpenCV.
+        
+        Args:
+            source: Video source whose capture is used (and left open)
+            frame_rate: Keep one frame every N seconds
+            
+        Yields:
+            (frame_number, timestamp, retrieve, retrieve_gray) tuples; the callables
+            return the BGR frame or its luma plane and are only valid until the next tuple
+        """
+        cap = source.capture()
         
         if not cap.isOpened():
-            raise ValueError(f"Could not open video file: {video_path}")
+            raise ValueError(f"Could not open video file: {source.path}")
         
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        frame_interval = fps * frame_rate
+        fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+        frame_interval = max(1, fps * frame_rate)
         frame_count = 0
-        extracted_count = 0
         
-        print(f"Extracting frames every {frame_rate} seconds from {video_path}...")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).lower()
+        if codec in _HEVC_FOURCCS:
+            print("⚠️ Video is H.265/HEVC encoded; decoding is slow. Consider transcoding to H.264 "
+                  "or using the pyav/nvdec decoder.")
+        
+        # retrieve() decodes into this buffer instead of allocating a frame each time
+        # (kept frames never outlive an iteration: resize and encode make copies)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_buf = np.empty((height, width, 3), np.uint8) if width and height else None
+        
+        # Ask for raw I420 frames so the hash can use the Y plane directly and the
+        # BGR conversion is only paid for frames that are encoded. Backends that
+        # ignore the request keep returning BGR, which is detected per frame.
+        # A shared capture may still be in raw mode from an earlier pass
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        if RAW_YUV_DECODE and width and height and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            frame_buf = None
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        def is_i420(frame: np.ndarray) -> bool:
+            return frame.ndim == 2 and frame.shape == (height * 3 // 2, width)
+        
+        grab = cap.grab
+        # grab() advances without the YUV->BGR conversion; retrieve() only kept frames
+        while grab():
+            retrieved = []
             
-            if frame_count % frame_interval == 0:
-                timestamp = frame_count / fps
-                
-                # Save frame temporarily
-                temp_frame_path = f"/tmp/frame_{extracted_count}.jpg"
-                cv2.imwrite(temp_frame_path, frame)
-                
-                frames_data.append({
-                    "frame_number": frame_count,
-                    "timestamp": timestamp,
-                    "path": temp_frame_path
-                })
-                extracted_count += 1
+            def retrieve_raw(retrieved=retrieved) -> Optional[np.ndarray]:
+                # One retrieve() per grabbed frame, shared by both views
+                nonlocal frame_buf
+                if not retrieved:
+                    ret, frame = cap.retrieve(frame_buf)
+                    retrieved.append(frame if ret else None)
+                    if ret:
+                        frame_buf = frame
+                return retrieved[0]
             
-            frame_count += 1
-        
-        cap.release()
-        print(f"Extracted {extracted_count} frames")
-        return frames_data
+            def retrieve(retrieve_raw=retrieve_raw) -> Optional[np.ndarray]:
+                frame = retrieve_raw()
+                if frame is not None and is_i420(frame):
+                    return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
+                return frame
+            
+            def retrieve_gray(retrieve_raw=retrieve_raw) -> Optional[np.ndarray]:
+                frame = retrieve_raw()
+                if frame is None:
+                    return None
+                if is_i420(frame):
+                    return frame[:height]
+                return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            
+            yield frame_count, frame_count / fps, retrieve, retrieve_gray
+            
+            # Skip to the next sampled frame with nothing but grab() calls
+            for _ in range(frame_interval - 1):
+                if not grab():
+                    return
+            frame_count += frame_interval
     
-    def analyze_frame(self, frame_path: str, timestamp: float) -> Dict:
+    def _decode_pyav(self, video_path: str, frame_rate: int, hwaccel: bool = False) -> Iterator[tuple]:
         """
-        Analyze a single frame using Gemini Vision API.
+        Sample one frame every frame_rate seconds with PyAV (libav).
         
         Args:
-            frame_path: Path to the frame image
-            timestamp: Timestamp of the frame in the video
+            video_path: Path to the video file
+            frame_rate: Keep one frame every N seconds
+            hwaccel: Decode on the GPU (NVDEC) when PyAV supports it, with software fallback
             
-        Returns:
-            Dictionary containing analysis results
+        Yields:
+            (frame_number, timestamp, retrieve, retrieve_gray) tuples; the
+            callables convert the decoded frame to BGR or to its luma plane
         """
-        prompt = """
-        Analyze this construction site image and provide detailed information in JSON format:
+        import av
         
-        {
-            "worker_action": "Detailed description of what the worker is doing",
-            "tools_visible": ["list", "of", "tools"],
-            "safety_equipment": ["list", "of", "safety", "gear"],
-            "location_zone": "area where worker is located",
-            "potential_hazards": ["list", "of", "visible", "hazards"],
-            "action_category": "measuring/cutting/installing/securing/finishing"
-        }
+        open_kwargs = {}
+        if hwaccel:
+            try:
+                from av.codec.hwaccel import HWAccel
+                open_kwargs["hwaccel"] = HWAccel(device_type="cuda", allow_software_fallback=True)
+            except ImportError:
+                print("⚠️ This PyAV version has no hardware decoding support; decoding on CPU")
         
-        Focus on:
-        1. Specific actions being performed
-        2. Tools and equipment in use
-        3. Safety equipment worn by workers
-        4. Work area and positioning
-        5. Any safety concerns
+        try:
+            container = av.open(video_path, **open_kwargs)
+        except Exception as e:
+            raise ValueError(f"Could not open video file: {video_path}") from e
         
-        Respond ONLY with valid JSON, no other text.
+        with container:
+            stream = container.streams.video[0]
+            # Frame-threaded decoding across all cores
+            stream.thread_type = "AUTO"
+            fps = float(stream.average_rate or 0) or 30.0
+            next_timestamp = 0.0
+            for frame_count, frame in enumerate(container.decode(stream)):
+                timestamp = frame.time if frame.time is not None else frame_count / fps
+                if timestamp + 1e-6 < next_timestamp:
+                    continue
+                yield (frame_count, timestamp,
+                       lambda frame=frame: frame.to_ndarray(format="bgr24"),
+                       lambda frame=frame: frame.to_ndarray(format="gray"))
+                next_timestamp += frame_rate
+                if next_timestamp <= timestamp:
+                    next_timestamp = timestamp + frame_rate
+    
+    def analyze_frame(self, frame: Union[bytes, str], timestamp: float) -> Dict:
         """
+        Analyze a single frame using Gemini Vision API.
         
+        Args:
+            frame: JPEG-encoded frame bytes, or a path to an image file
+            timestamp: Timestamp of the frame in the video
+            
+        Returns:
+            Dictionary containing analysis results
+        """
         try:
-            # Upload and analyze the image
-            image_file = genai.upload_file(path=frame_path)
-            response = self.model.generate_content([image_file, prompt])
+            # Send the image inline; only oversized images and paths use the Files API
+            if isinstance(frame, str):
+                image = genai.upload_file(path=frame)
+            elif len(frame) > INLINE_IMAGE_LIMIT:
+                image = genai.upload_file(path=io.BytesIO(frame), mime_type="image/jpeg")
+            else:
+                image = {"mime_type": "image/jpeg", "data": frame}
+            response = generate_with_retry(self.model, [image, FRAME_PROMPT], REQUEST_TIMEOUT)
             
             # Parse the response
-            response_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            analysis = json.loads(response_text)
+            analysis = parse_json_response(response.text)
             analysis["timestamp"] = timestamp
             
             return analysis
@@ -151,91 +856,313 @@ class VideoAnalyzer:
             }
         except Exception as e:
             print(f"Error analyzing frame: {e}")
-            return {
-                "timestamp": timestamp,
-                "worker_action": "Error in analysis",
-                "tools_visible": [],
-                "safety_equipment": [],
-                "location_zone": "unknown",
-                "potential_hazards": [],
-                "action_category": "unknown",
-                "error": str(e)
-            }
+            return _error_analysis(timestamp, e)
     
-    def analyze_video(self, video_path: str, frame_rate: int = 2) -> List[Dict]:
+    def analyze_frames(self, frames: List[Dict]) -> List[Optional[Dict]]:
         """
-        Analyze entire video and return timeline of actions.
+        Analyze several frames with a single Gemini request.
         
         Args:
-            video_path: Path to the video file
-            frame_rate: Extract and analyze one frame every N seconds
+            frames: Frame dictionaries from extract_frames
             
         Returns:
-            List of analysis results for each frame
+            Analysis results in frame order; None for frames missing from the reply
         """
-        print(f"\n🎥 Starting video analysis: {video_path}")
+        contents = [BATCH_FRAME_PROMPT]
+        for i, frame_data in enumerate(frames):
+            contents.append({"mime_type": "image/jpeg", "data": frame_data["jpeg"]})
+            contents.append(f"Frame {i} at t={frame_data['timestamp']:.1f}s")
         
-        # Extract frames
-        frames = self.extract_frames(video_path, frame_rate)
+        try:
+            response = generate_with_retry(self.model, contents, REQUEST_TIMEOUT)
+            reply = parse_json_response(response.text)
+            by_idx = {entry.get("idx"): entry for entry in reply.get("frames", []) if isinstance(entry, dict)}
+        except Exception as e:
+            print(f"Error analyzing frame batch: {e}")
+            by_idx = {}
         
-        # Analyze each frame
         results = []
         for i, frame_data in enumerate(frames):
-            print(f"Analyzing frame {i+1}/{len(frames)} (t={frame_data['timestamp']:.1f}s)...")
-            
-            analysis = self.analyze_frame(frame_data["path"], frame_data["timestamp"])
+            analysis = by_idx.get(i)
+            if analysis is not None:
+                analysis = {key: value for key, value in analysis.items() if key != "idx"}
+                analysis["timestamp"] = frame_data["timestamp"]
             results.append(analysis)
-            
-            # Clean up temporary frame
-            if os.path.exists(frame_data["path"]):
-                os.remove(frame_data["path"])
-            
-            # Rate limiting - avoid hitting API limits
-            time.sleep(1)
+        return results
+    
+    def analyze_video(self, video_path: Union[str, _VideoSource], frame_rate: int = 2,
+                      dedupe_threshold: int = DEDUPE_THRESHOLD) -> List[Dict]:
+        """
+        Analyze entire video and return timeline of actions.
         
+        Args:
+            video_path: Path to the video file, or a _VideoSource to reuse
+            frame_rate: Extract and analyze one frame every N seconds
+            dedupe_threshold: Hash distance below which a frame counts as a
+                duplicate of the last analyzed frame (0 disables)
+            
+        Returns:
+            List of analysis results for each frame
+        """
+        results = list(self.iter_analyze_video(video_path, frame_rate, dedupe_threshold))
         print(f"\n✅ Video analysis complete! Analyzed {len(results)} frames")
         return results
     
-    def analyze_video_direct(self, video_path: str) -> List[Dict]:
+    def iter_analyze_video(self, video_path: Union[str, _VideoSource], frame_rate: int = 2,
+                           dedupe_threshold: int = DEDUPE_THRESHOLD) -> Iterator[Dict]:
         """
-        Analyze entire video at once using Gemini's video understanding.
+        Analyze a video, yielding each frame's analysis in frame order as soon as it is ready.
+        
+        Frames are decoded and encoded on a reader thread while worker threads
+        run the Gemini requests, so decoding overlaps the network round trips.
+        Each request carries frame_batch_size frames.
+        Near-identical consecutive frames are not sent to Gemini; they reuse the
+        analysis of the last frame that was.
         
         Args:
-            video_path: Path to the video file
+            video_path: Path to the video file, or a _VideoSource to reuse
+            frame_rate: Extract and analyze one frame every N seconds
+            dedupe_threshold: Hash distance below which a frame counts as a
+                duplicate of the last analyzed frame (0 disables)
+            
+        Yields:
+            Analysis results, one per extracted frame
+        """
+        print(f"\n🎥 Starting video analysis: {getattr(video_path, 'path', video_path)}")
+        
+        # Bounded so the reader stops decoding when Gemini falls behind
+        read_q = queue.Queue(maxsize=self.prefetch)
+        result_q = queue.Queue()
+        reader_errors = []
+        # Frame index -> timestamp of frames that duplicate the last analyzed frame
+        duplicates = {}
+        # Frame indices that could not be decoded or encoded
+        dropped = set()
+        # Set when the consumer closes the generator or finishes; the threads
+        # then stop decoding and sending requests
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            """Queue an item for the workers; False if cancelled while the queue was full."""
+            while True:
+                try:
+                    read_q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    if stop.is_set():
+                        return False
+        
+        def reader():
+            last_hash = None
+            batch = []
+            frames = self.iter_lazy_frames(video_path, frame_rate)
+            try:
+                for idx, frame in enumerate(frames):
+                    if stop.is_set():
+                        return
+                    if dedupe_threshold > 0:
+                        # The hash only needs a tiny grayscale thumbnail; duplicates
+                        # are never resized or JPEG-encoded
+                        phash = frame.phash()
+                        if last_hash is not None and hamming_distance(phash, last_hash) < dedupe_threshold:
+                            duplicates[idx] = frame.timestamp
+                            continue
+                    jpeg = frame.encode()
+                    if jpeg is None:
+                        dropped.add(idx)
+                        continue
+                    if dedupe_threshold > 0:
+                        last_hash = phash
+                    batch.append((idx, {"frame_number": frame.frame_number, "timestamp": frame.timestamp, "jpeg": jpeg}))
+                    if len(batch) == self.frame_batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch:
+                    put(batch)
+            except Exception as e:
+                reader_errors.append(e)
+            finally:
+                frames.close()
+                for _ in range(self.max_concurrency):
+                    put(None)
+        
+        def acquire() -> bool:
+            """Wait for the rate limiter; False if cancelled in the meantime."""
+            # The rate limiter keeps concurrent workers under the API quota
+            self.rate_limiter.acquire()
+            return not stop.is_set()
+        
+        def worker():
+            try:
+                while not stop.is_set():
+                    try:
+                        batch = read_q.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if batch is None or not acquire():
+                        break
+                    results = []
+                    try:
+                        if len(batch) == 1:
+                            analyses = [self.analyze_frame(batch[0][1]["jpeg"], batch[0][1]["timestamp"])]
+                        else:
+                            analyses = self.analyze_frames([frame_data for _, frame_data in batch])
+                        for (_, frame_data), analysis in zip(batch, analyses):
+                            if analysis is None:
+                                # Missing from the batched reply; analyze it on its own
+                                if not acquire():
+                                    return
+                                analysis = self.analyze_frame(frame_data["jpeg"], frame_data["timestamp"])
+                            results.append(analysis)
+                    except Exception as e:
+                        # Keep the worker alive; a dead one would cut every later frame from the output
+                        print(f"Error analyzing frame batch: {e}")
+                        results += [_error_analysis(frame_data["timestamp"], e) for _, frame_data in batch[len(results):]]
+                    for (idx, frame_data), analysis in zip(batch, results):
+                        result_q.put((idx, frame_data["timestamp"], analysis))
+            finally:
+                result_q.put(None)
+        
+        threads = [threading.Thread(target=reader, daemon=True)]
+        threads += [threading.Thread(target=worker, daemon=True) for _ in range(self.max_concurrency)]
+        for thread in threads:
+            thread.start()
+        
+        # Results arrive out of order; hold them until every earlier frame is out.
+        # A duplicate always copies the last analyzed frame before it, which is
+        # the last analyzed frame emitted so far.
+        pending = {}
+        next_idx = 0
+        last_analysis = None
+        analyzed = 0
+        finished = 0
+        try:
+            while True:
+                if finished < self.max_concurrency:
+                    item = result_q.get()
+                    if item is None:
+                        finished += 1
+                    else:
+                        idx, timestamp, analysis = item
+                        pending[idx] = analysis
+                        analyzed += 1
+                        print(f"Analyzed frame {analyzed} (t={timestamp:.1f}s)")
+                
+                while True:
+                    if next_idx in pending:
+                        last_analysis = pending.pop(next_idx)
+                        yield last_analysis
+                    elif next_idx in duplicates and last_analysis is not None:
+                        yield {**last_analysis, "timestamp": duplicates[next_idx]}
+                    elif next_idx not in dropped:
+                        break
+                    next_idx += 1
+                
+                if finished == self.max_concurrency:
+                    break
+        finally:
+            # Also runs on GeneratorExit when the consumer stops early; requests
+            # already in flight are allowed to finish
+            stop.set()
+            for thread in threads:
+                thread.join()
+        
+        if reader_errors:
+            raise reader_errors[0]
+        if duplicates:
+            print(f"Skipped {len(duplicates)} near-duplicate frames")
+    
+    def _upload_video(self, source: _VideoSource):
+        """
+        Upload a video to the Files API, reusing an earlier upload of the same content.
+        
+        Args:
+            source: Video to upload
             
         Returns:
-            List of timestamped action descriptions
+            Gemini file handle for the video
         """
-        print(f"\n🎥 Starting direct video analysis: {video_path}")
+        digest = source.sha256()
+        cached = self._upload_cache.get(digest)
+        if cached is not None:
+            try:
+                video_file = genai.get_file(cached.name)
+                expires = video_file.expiration_time
+                if (video_file.state.name == "ACTIVE"
+                        and (expires is None or expires > datetime.now(timezone.utc) + UPLOAD_EXPIRY_MARGIN)):
+                    print("Reusing previously uploaded video")
+                    return video_file
+            except Exception as e:
+                print(f"Cached upload unavailable, re-uploading: {e}")
+            del self._upload_cache[digest]
         
-        prompt = """
-        Analyze this construction work video comprehensively. Provide a timeline of worker actions in JSON format:
+        print("Uploading video to Gemini...")
+        video_file = genai.upload_file(path=source.path)
+        self._upload_cache[digest] = video_file
+        print("Video uploaded.")
+        return video_file
+    
+    def _cached_video_model(self, video_file):
+        """
+        Build a model whose context cache holds the video and the timeline prompt.
         
-        {
-            "actions": [
-                {
-                    "timestamp_start": 0.0,
-                    "timestamp_end": 5.0,
-                    "worker_action": "Worker measuring wall with tape measure",
-                    "tools_visible": ["tape measure"],
-                    "safety_equipment": ["hard hat", "safety vest"],
-                    "location_zone": "main work area",
-                    "action_category": "measuring"
-                }
-            ],
-            "overall_summary": "Brief summary of the entire video",
-            "compliance_notes": "Any notable safety or procedural observations"
-        }
+        Repeat analyses of the same upload then reference the cache instead of
+        re-sending and re-tokenizing the video and prompt.
+        
+        Args:
+            video_file: Gemini file handle of the uploaded video
+            
+        Returns:
+            GenerativeModel bound to the cached content, or None if caching is unavailable
+        """
+        if not hasattr(genai, "caching"):
+            return None
+        cached = self._context_cache.get(video_file.name)
+        if cached is None or cached.expire_time <= datetime.now(timezone.utc) + UPLOAD_EXPIRY_MARGIN:
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=self.model_name,
+                    system_instruction=VIDEO_PROMPT,
+                    contents=[video_file],
+                    ttl=CONTEXT_CACHE_TTL
+                )
+            except Exception as e:
+                # e.g. the model has no caching support or the video is below the minimum size
+                print(f"Context caching unavailable, sending the video inline: {e}")
+                return None
+            self._context_cache[video_file.name] = cached
+        return genai.GenerativeModel.from_cached_content(cached_content=cached)
+    
+    def analyze_video_direct(self, video_path: Union[str, _VideoSource]) -> List[Dict]:
+        """
+        Analyze entire video at once using Gemini's video understanding.
         
-        For each distinct action segment in the video:
-        - Note the time range
-        - Describe the specific action
-        - List tools and equipment
-        - Identify the work zone
-        - Categorize the action type
+        Args:
+            video_path: Path to the video file, or a _VideoSource to reuse
+            
+        Returns:
+            List of timestamped action descriptions
+        """
+        source, owned = _VideoSource.wrap(video_path)
+        try:
+            return self._analyze_video_direct(source)
+        finally:
+            if owned:
+                source.close()
+    
+    def _analyze_video_direct(self, source: _VideoSource) -> List[Dict]:
+        """
+        analyze_video_direct on an open source, so the fallback reuses it.
         
-        Respond ONLY with valid JSON.
+        Args:
+            source: Video to analyze
+            
+        Returns:
+            List of timestamped action descriptions
         """
+        video_path = source.path
+        print(f"\n🎥 Starting direct video analysis: {video_path}")
         
         try:
             # Check file size (Gemini has limits)
@@ -244,25 +1171,18 @@ class VideoAnalyzer:
                 print(f"⚠️ Warning: Video file is {file_size:.1f}MB. May exceed API limits.")
                 print("Consider using frame-by-frame analysis instead.")
             
-            # Upload video
-            print("Uploading video to Gemini...")
-            video_file = genai.upload_file(path=video_path)
-            print("Video uploaded. Analyzing...")
+            video_file = self._upload_video(source)
+            print("Analyzing...")
             
             # Generate analysis
-            response = self.model.generate_content([video_file, prompt])
+            cached_model = self._cached_video_model(video_file) if self.use_context_cache else None
+            if cached_model is not None:
+                response = generate_with_retry(cached_model, "Provide the timeline for this video.", VIDEO_REQUEST_TIMEOUT)
+            else:
+                response = generate_with_retry(self.model, [video_file, VIDEO_PROMPT], VIDEO_REQUEST_TIMEOUT)
             
             # Parse response
-            response_text = response.text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            analysis = json.loads(response_text)
+            analysis = parse_json_response(response.text)
             
             print(f"\n✅ Video analysis complete!")
             return analysis.get("actions", [])
@@ -270,7 +1190,7 @@ class VideoAnalyzer:
         except Exception as e:
             print(f"Error in direct video analysis: {e}")
             print("Falling back to frame-by-frame analysis...")
-            return self.analyze_video(video_path, frame_rate=3)
+            return self.analyze_video(source, frame_rate=3)
 
 
 if __name__ == "__main__":
@@ -280,12 +1200,15 @@ if __name__ == "__main__":
     # Example usage
     video_path = "examples/sample_videos/drywall_install.mp4"
     if os.path.exists(video_path):
-        results = analyzer.analyze_video(video_path, frame_rate=5)
-        
-        # Save results
-        with open("video_analysis_results.json", "w") as f:
-            json.dump(results, f, indent=2)
+        # Stream results as JSON Lines so partial output survives a crash
+        with open("video_analysis_results.jsonl", "wb") as f:
+            for analysis in analyzer.iter_analyze_video(video_path, frame_rate=5):
+                if orjson is not None:
+                    f.write(orjson.dumps(analysis) + b"\n")
+                else:
+                    f.write(json.dumps(analysis).encode("utf-8") + b"\n")
+                f.flush()
         
-        print("\nResults saved to video_analysis_results.json")
+        print("\nResults saved to video_analysis_results.jsonl")
     else:
         print(f"Test video not found: {video_path}")